@@ -1,8 +1,9 @@
-from os import getcwd
-from os.path import join
-from numpy import empty
+from os import getcwd,listdir,makedirs,replace
+from os.path import join,exists,basename,dirname
+from numpy import empty,array,save,load
 import matplotlib.pyplot as plt
 import json as j
+from sys import argv
 
 def kplib_reader(
     instance_type: str = "strongly_correlated",
@@ -74,6 +75,107 @@ def kplib_reader(
                     weights[counter - 4] = int(item[1])
             return weights, costs, objective
 
+def spprclib_reader(filename: str, factor: int = 1000):
+    """Reads in an SPPRCLIB instance from data/sppcc. Distances and node weights are divided by factor and rounded down.
+    Returns the capacity, the node demands, the distance matrix and the node weights."""
+    with open(filename, 'r') as f:
+        lines = f.readlines()
+    
+        linecounter = 7
+        distances,demands = [],[]
+        mode = 'matrix'
+        while linecounter < len(lines):
+            line = lines[linecounter].strip()
+            linecounter += 1
+            if line.startswith('NODE_WEIGHT_SECTION'):
+                node_weights = [int(float(w)/factor) for w in lines[linecounter].strip().split()]
+                linecounter += 1 # Skips the line of node weights that was just read
+            elif line.startswith('CAPACITY'):
+                capacity = int(line.strip().split()[-1])
+            elif line.startswith('DEMAND_SECTION'):
+                mode = 'demand'
+            elif line.startswith('EOF'):
+                break
+            else:
+                if mode == 'matrix':
+                    row = [int(float(x)/factor) for x in line.split()]
+                    distances.append(row)
+                elif mode == 'demand':
+                    demands.append(int(line.split()[-1]))
+
+        return capacity,demands,distances,node_weights
+
+# Binary instance store: data/store contains one .npy shard per kplib instance class and per SPPRCLIB distance matrix, plus a catalogue.json.
+# Readers memory-map the shards, so an instance is a view into the file and nothing is parsed. Text readers are used if the store is missing.
+kplib_types = {"uncorrelated":"00Uncorrelated","strongly_correlated":"02StronglyCorrelated"}
+kplib_sizes = [50, 100, 200, 500, 1000, 2000, 5000, 10000]
+kplib_weight_ubs = [1000, 10000]
+store_cache = {} # Catalogue and memory maps of the store, opened once per process
+
+def store_path(*parts) -> str:
+    return join(getcwd(), "data", "store", *parts)
+
+def convert_data_to_store(factor: int = 1000):
+    """One-time conversion of data/ into the binary store. kplib instances of one type, size and weight bound are stacked into
+    a weights and a costs shard with one row per instance index. SPPRCLIB distance matrices are stored with distances divided by factor."""
+    makedirs(store_path(), exist_ok=True)
+    catalogue = {'kplib':{},'spprclib':{},'spprclib_factor':factor}
+    for instance_type in kplib_types:
+        for size in kplib_sizes:
+            for weight_ub in kplib_weight_ubs:
+                instances = [kplib_reader(instance_type, size, weight_ub, index) for index in range(100)]
+                if any(instance == False for instance in instances): continue
+                name = instance_type+"_"+str(size)+"_"+str(weight_ub)
+                save(store_path(name+"_weights.npy"), array([weights for weights,costs,capacity in instances]))
+                save(store_path(name+"_costs.npy"), array([costs for weights,costs,capacity in instances]))
+                catalogue['kplib'][name] = {'weights':name+"_weights.npy",'costs':name+"_costs.npy",'capacities':[capacity for weights,costs,capacity in instances]}
+    folder = join(getcwd(), "data", "sppcc")
+    for filename in sorted(listdir(folder)):
+        if not filename.lower().endswith(".sppcc"): continue
+        capacity,demands,distances,node_weights = spprclib_reader(join(folder, filename), factor)
+        save(store_path(filename+"_distances.npy"), array(distances))
+        catalogue['spprclib'][filename] = {'distances':filename+"_distances.npy",'capacity':capacity,'demands':demands,'node_weights':node_weights}
+    with open(store_path("catalogue.json"), "w") as file:
+        j.dump(catalogue, file)
+    store_cache.clear()
+
+def open_store():
+    """Returns the catalogue of the store, or False if there is no store."""
+    if 'catalogue' not in store_cache:
+        if not exists(store_path("catalogue.json")): return False
+        with open(store_path("catalogue.json")) as file:
+            store_cache['catalogue'] = j.load(file)
+    return store_cache['catalogue']
+
+def open_shard(filename: str):
+    """Memory map of a shard of the store."""
+    if filename not in store_cache: store_cache[filename] = load(store_path(filename), mmap_mode='r')
+    return store_cache[filename]
+
+def kplib_store_reader(
+    instance_type: str = "strongly_correlated",
+    size: int = 50,
+    weight_ub: int = 1000,
+    index: int = 0,
+):
+    """Reads in kplib instances from the binary store, with the same parameters and results as kplib_reader.
+    Weights and costs are read-only views into the memory-mapped shards. Falls back to kplib_reader if the instance is not in the store."""
+    catalogue = open_store()
+    name = str(instance_type)+"_"+str(size)+"_"+str(weight_ub)
+    if catalogue == False or name not in catalogue['kplib'] or index not in range(100):
+        return kplib_reader(instance_type, size, weight_ub, index)
+    entry = catalogue['kplib'][name]
+    return open_shard(entry['weights'])[index], open_shard(entry['costs'])[index], entry['capacities'][index]
+
+def spprclib_store_reader(filename: str, factor: int = 1000):
+    """Reads in an SPPRCLIB instance from the binary store, with the same parameters and results as spprclib_reader.
+    The distance matrix is a read-only view into the memory-mapped shard. Falls back to spprclib_reader if the instance is not in the store."""
+    catalogue = open_store()
+    if catalogue == False or basename(filename) not in catalogue['spprclib'] or factor != catalogue['spprclib_factor']:
+        return spprclib_reader(filename, factor)
+    entry = catalogue['spprclib'][basename(filename)]
+    return entry['capacity'], entry['demands'], open_shard(entry['distances']), entry['node_weights']
+
 def simple_CF_plot(x,y):
     plt.plot(x, y, marker='o', linestyle='-', color='b', label='Line 1')
     plt.xlabel('Candidate value')
@@ -87,6 +189,19 @@ def write_as_json(current_data,filename:str):
     with open(join('results', filename)+".json", "w") as file:
         j.dump(current_data, file)
 
+def write_state(state: dict, filename: str):
+    """Writes a JSON state file, e.g. a checkpoint or an instance cache. The file is replaced in one step, so a process that is killed while writing leaves the previous state."""
+    makedirs(dirname(filename) or '.', exist_ok=True)
+    with open(filename+".tmp", "w") as file:
+        j.dump(state, file)
+    replace(filename+".tmp", filename)
+
+def read_state(filename: str):
+    """Reads a state file written by write_state, or returns False if there is none."""
+    if not exists(filename): return False
+    with open(filename, "r") as file:
+        return j.load(file)
+
 def read_json(filename: str):
     """Read a JSON file from the 'results' directory and return its contents as a dictionary."""
     try:
@@ -94,4 +209,11 @@ def read_json(filename: str):
             return j.load(file)
     except (FileNotFoundError, j.JSONDecodeError) as e:
         print(f"Error reading the file: {e}")
-        return False
\ No newline at end of file
+        return False
+
+if __name__ == "__main__":
+    # Example execution: python3 IO.py store
+    # Converts all instances in data/ into the binary store in data/store, which is used by kplib_store_reader and spprclib_store_reader.
+    if len(argv) > 1 and argv[1] == 'store':
+        convert_data_to_store()
+        print("Converted data/ into", store_path())
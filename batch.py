@@ -0,0 +1,66 @@
+from IO import write_as_json
+from main import load_instance,run_experiment,result_name
+from instance_cache import InstanceCache
+from solver import bip_solve_cover
+from sys import argv
+from os.path import exists,join
+from itertools import product
+from multiprocessing import get_context
+from time import time
+import json as j
+
+options = ['order','max_cut_age','lazy','preprocessing','heuristic'] # Optional grid keys that are passed on to run_cf
+
+def grid_jobs(grid:dict) -> list:
+    """ All experiments of a grid specification, which lists the values of each command line parameter of main.py, e.g.
+    {"instance_types":["uncorrelated"],"instance_sizes":[10,20],"favoured_solution_space_types":["p","n","c"],
+     "mutable_parameter_space_sizes":["0.05"],"instance_indices":[0,1,2],"ce_types":["strong","X"],"timelimit":36000}
+    Optional keys are "timelimit" (per job, in seconds), "epsilon" and the solver options in options."""
+    return [job for job in product(grid['instance_types'],grid['instance_sizes'],grid['favoured_solution_space_types'],grid['mutable_parameter_space_sizes'],grid['instance_indices'],grid['ce_types'])]
+
+def pending_jobs(jobs:list) -> list:
+    """ Drops all jobs whose results file already exists."""
+    return [job for job in jobs if not exists(join('results',result_name(*job)+".json"))]
+
+def group_by_instance(jobs:list) -> dict:
+    """ Jobs grouped by (instance type, instance size, instance index), so each instance is read and solved only once."""
+    groups = {}
+    for job in jobs: groups.setdefault((job[0],job[1],job[4]),[]).append(job)
+    return groups
+
+def run_instance_jobs(task) -> list:
+    """ Runs all jobs on one instance. Reads the instance and solves its nominal problem once and writes one results file per job.
+    Jobs are checkpointed to the runs folder, so a job that was interrupted continues from its checkpoint when the grid is run again.
+    The nominal solution, bounds and cuts of the instance are shared through its InstanceCache in the cache folder, also with later grids."""
+    (instance_type,instance_size,instance_index),jobs,timelimit,epsilon,solver_options = task
+    instance = load_instance(instance_type,int(instance_size),int(instance_index))
+    instance_cache = InstanceCache(*instance,'cache')
+    nominal = instance_cache.nominal(lambda: bip_solve_cover(*instance))
+    instance_cache.save()
+    finished = []
+    for job in jobs:
+        tracked_data, name = run_experiment(*job,epsilon=epsilon,timelimit=timelimit,instance=instance,nominal=nominal,checkpoint_dir='runs',resume=True,cache_dir='cache',**solver_options)
+        write_as_json(tracked_data,name)
+        finished.append((name,tracked_data['total_runtime_in_s']))
+    return finished
+
+def run_grid(grid:dict,processes:int=1):
+    """ Runs all missing experiments of a grid on a local process pool. Each process works on all jobs of one instance at a time."""
+    jobs = pending_jobs(grid_jobs(grid))
+    groups = group_by_instance(jobs)
+    print("Running",len(jobs),"jobs on",len(groups),"instances with",processes,"processes.")
+    tasks = [(instance,instance_jobs,grid.get('timelimit',10*3600),grid.get('epsilon',0.01),{key:grid[key] for key in options if key in grid}) for instance,instance_jobs in groups.items()]
+    starttime,counter = time(),0
+    with get_context("spawn").Pool(processes) as pool:
+        for finished in pool.imap_unordered(run_instance_jobs,tasks):
+            for name,runtime in finished:
+                counter += 1
+                print("Finished",counter,"out of",len(jobs),":",name,"in",round(runtime,2),"s, total",round(time()-starttime,2),"s")
+
+if __name__ == "__main__":
+    # Example execution: python3 batch.py grid.json 8
+    # Meaning: python3 batch.py [grid specification] [number of processes]
+    # The grid specification is a JSON file in the format described in grid_jobs. Jobs whose results file exists are skipped.
+    with open(argv[1]) as file:
+        grid = j.load(file)
+    run_grid(grid,int(argv[2]) if len(argv) > 2 else 1)
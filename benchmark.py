@@ -0,0 +1,115 @@
+from IO import kplib_store_reader
+from main import load_instance,run_experiment
+from profiling import phases
+from batch import grid_jobs
+from sys import argv
+from os import devnull,makedirs
+from os.path import join,exists
+from contextlib import redirect_stdout
+from multiprocessing import get_context
+from resource import getrusage,RUSAGE_SELF
+from time import time,process_time
+import gurobipy as gp
+import json as j
+
+# Benchmark tiers in the grid format of batch.py, or as a list of jobs. quick finishes in about a minute on a laptop, the larger tiers take correspondingly longer.
+# The instances of quick are picked so that every experiment searches objective candidates, most small instances are solved before the first candidate.
+tiers = {
+    'quick':{"jobs":[(instance_type,instance_size,favoured_solution_space_type,"0.05",instance_index,ce_type) for instance_type,instance_size,favoured_solution_space_type,instance_index in [
+                 ("uncorrelated",10,"n",2),("uncorrelated",15,"p",1),("uncorrelated",15,"p",2),("uncorrelated",15,"p",8),("uncorrelated",15,"n",8),("uncorrelated",15,"c",5),
+                 ("strongly_correlated",10,"p",4),("strongly_correlated",10,"p",7),("strongly_correlated",10,"n",3),("strongly_correlated",10,"n",4),
+                 ("strongly_correlated",15,"n",1),("strongly_correlated",15,"c",9)] for ce_type in ["strong","X"]],"timelimit":120},
+    'medium':{"instance_types":["uncorrelated","strongly_correlated"],"instance_sizes":[20,50],"favoured_solution_space_types":["p","n","c"],
+              "mutable_parameter_space_sizes":["0.05"],"instance_indices":[1,2],"ce_types":["strong","X"],"timelimit":600},
+    'full':{"instance_types":["uncorrelated","strongly_correlated"],"instance_sizes":[50,100,200,500],"favoured_solution_space_types":["p","n","c"],
+            "mutable_parameter_space_sizes":["0.05"],"instance_indices":[1,2,3],"ce_types":["strong","X"],"timelimit":3600},
+}
+# Relative increase over the baseline that counts as a regression. Times are gated by CPU time, which unlike wall time hardly depends on the load of the machine
+tolerances = {'cpu_time':0.5,'solver_calls':0.1,'peak_memory_mb':0.25}
+min_differences = {'cpu_time':0.25,'solver_calls':5,'peak_memory_mb':0} # Absolute increases up to these are noise, e.g. a quarter second or a few solver calls
+
+def run_case(job) -> dict:
+    """ Runs one experiment of a tier in a fresh process and returns its metrics. Output of the experiment is suppressed and Gurobi uses one thread,
+    so that times are comparable between runs. Peak memory is the maximum resident set size of the process. Solver calls are the solves of all models and DP
+    oracles, without the phases of profiling.phases that contain them."""
+    job,timelimit = job[:-1],job[-1]
+    instance_type,instance_size,favoured_solution_space_type,mutable_parameter_space_size,instance_index,ce_type = job
+    with open(devnull,'w') as output, redirect_stdout(output):
+        gp.setParam("Threads",1)
+        start = time()
+        kplib_store_reader(instance_type,max(int(instance_size),50),1000,int(instance_index))
+        read_time = time()-start
+        instance = load_instance(instance_type,int(instance_size),int(instance_index))
+        cpu_start = process_time()
+        tracked_data, name = run_experiment(*job,timelimit=timelimit,instance=instance)
+        cpu_time = process_time()-cpu_start
+    result,profile = tracked_data['result'],tracked_data['result']['profile']
+    return {
+        'name':name,
+        'Final_UB':result['Final_UB'],
+        'solved':result['solved'],
+        'total_iterations':result['total_iterations'],
+        'wall_time':tracked_data['total_runtime_in_s'],
+        'cpu_time':cpu_time,
+        'read_time':read_time,
+        'find_bounds_for_c_time':profile.get('find_bounds_for_c',{}).get('solve_time',0),
+        'is_cf_time':profile.get('is_cf',{}).get('solve_time',0),
+        'is_cf_calls':profile.get('is_cf',{}).get('solves',0),
+        'solver_calls':sum(counts['solves'] for model,counts in profile.items() if model not in phases),
+        'nodes':sum(counts['nodes'] for counts in profile.values()),
+        'peak_memory_mb':getrusage(RUSAGE_SELF).ru_maxrss/1024,
+    }
+
+def run_tier(tier:str) -> dict:
+    """ Runs all experiments of a tier one after another, each in its own process. Returns the metrics by results name."""
+    jobs = [job+(tiers[tier]['timelimit'],) for job in (tiers[tier]['jobs'] if 'jobs' in tiers[tier] else grid_jobs(tiers[tier]))]
+    metrics = {}
+    with get_context("spawn").Pool(1,maxtasksperchild=1) as pool:
+        for case in pool.imap(run_case,jobs):
+            metrics[case['name']] = case
+            print(case['name'],"UB",case['Final_UB'],"in",round(case['wall_time'],2),"s ("+str(round(case['cpu_time'],2)),"s CPU),",case['solver_calls'],"solver calls,",round(case['peak_memory_mb']),"MB")
+    return metrics
+
+def regressions(metrics:dict,baseline:dict) -> list:
+    """ Compares metrics with a baseline. Returns a message for every changed result and every time, solver call or memory increase beyond the tolerances."""
+    messages = []
+    for name,case in metrics.items():
+        if name not in baseline:
+            messages.append(name+": not in baseline")
+            continue
+        reference = baseline[name]
+        if case['Final_UB'] != reference['Final_UB'] or case['solved'] != reference['solved']:
+            messages.append(name+": result changed from "+str(reference['Final_UB'])+" ("+str(reference['solved'])+") to "+str(case['Final_UB'])+" ("+str(case['solved'])+")")
+        for metric,tolerance in tolerances.items():
+            if case[metric] > reference[metric]*(1+tolerance) and case[metric]-reference[metric] > min_differences[metric]:
+                messages.append(name+": "+metric+" increased from "+str(round(reference[metric],2))+" to "+str(round(case[metric],2)))
+    return messages
+
+def benchmark_path(name:str) -> str:
+    makedirs('benchmarks',exist_ok=True)
+    return join('benchmarks',name+'.json')
+
+if __name__ == "__main__":
+    # Example execution: python3 benchmark.py quick
+    # Meaning: python3 benchmark.py [tier] [save]
+    # [tier]: quick, medium or full, see tiers
+    # Runs the tier, writes its metrics to benchmarks/latest_[tier].json and compares them with benchmarks/baseline_[tier].json.
+    # The exit code is 1 if there are regressions. With save as second argument, the metrics become the new baseline instead.
+    tier = argv[1] if len(argv) > 1 else 'quick'
+    starttime = time()
+    metrics = run_tier(tier)
+    print("Finished tier",tier,"in",round(time()-starttime,2),"s, total wall time of experiments",round(sum(case['wall_time'] for case in metrics.values()),2),"s")
+    with open(benchmark_path('latest_'+tier),'w') as file:
+        j.dump(metrics,file,indent=1)
+    if len(argv) > 2 and argv[2] == 'save':
+        with open(benchmark_path('baseline_'+tier),'w') as file:
+            j.dump(metrics,file,indent=1)
+        print("Saved new baseline for tier",tier)
+    elif not exists(benchmark_path('baseline_'+tier)):
+        print("No baseline for tier",tier,"yet, run python3 benchmark.py",tier,"save to create one.")
+    else:
+        with open(benchmark_path('baseline_'+tier)) as file:
+            messages = regressions(metrics,j.load(file))
+        for message in messages: print("REGRESSION",message)
+        print("No regressions against the baseline." if messages == [] else str(len(messages))+" regressions against the baseline.")
+        exit(1 if messages != [] else 0)
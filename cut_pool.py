@@ -0,0 +1,48 @@
+class CutPool:
+    """ y cuts of a run. Can be used like the list of cuts it replaces: iterating gives each cut as a list of items, append adds a cut
+    and in is a hash lookup. Cuts are identified by their set of items, so the same cut in a different order is a duplicate.
+    A cut on a set of items implies the cuts on all its subsets, since weights are non-negative. Appending a cut removes the cuts on its subsets
+    and cuts on subsets of pooled cuts are not added.
+    valid_from optionally maps a cut to the smallest objective candidate for which it is valid (see cut_valid_from in solver.py). A cut then only
+    dominates cuts that are valid from the same or a larger candidate. Without it, all cuts are assumed to be valid for all remaining candidates,
+    which holds for an ascending search."""
+    def __init__(self,cuts=[],valid_from=None):
+        self.valid_from = valid_from
+        self.cuts = {} # Items of each cut, keyed by their set
+        self.thresholds = {} # Smallest valid candidate of each cut
+        self.containing = {} # Item -> set of the keys of all cuts that contain it
+        self.dominated = 0 # Number of cuts that were not added or removed because another cut implies them
+        for cut in cuts: self.append(cut)
+
+    def __len__(self) -> int:
+        return len(self.cuts)
+
+    def __iter__(self):
+        return iter(list(self.cuts.values()))
+
+    def __contains__(self,cut) -> bool:
+        return frozenset(cut) in self.cuts
+
+    def keys(self):
+        return self.cuts.keys()
+
+    def append(self,cut) -> bool:
+        """ Adds a cut and removes the cuts it dominates. Returns False if the cut is already in the pool or dominated by a pooled cut."""
+        key = frozenset(cut)
+        if key in self.cuts: return False
+        threshold = self.valid_from(list(cut)) if self.valid_from != None else 0
+        supersets = set.intersection(*[self.containing.get(item,set()) for item in key]) if key else set(self.cuts)
+        if any(self.thresholds[other] <= threshold for other in supersets):
+            self.dominated += 1
+            return False
+        for other in set().union(*[self.containing.get(item,set()) for item in key]):
+            if other < key and self.thresholds[other] >= threshold: self.remove(other)
+        self.cuts[key],self.thresholds[key] = list(cut),threshold
+        for item in key: self.containing.setdefault(item,set()).add(key)
+        return True
+
+    def remove(self,key):
+        """ Removes a dominated cut, given by its set of items."""
+        for item in key: self.containing[item].discard(key)
+        del self.cuts[key],self.thresholds[key]
+        self.dominated += 1
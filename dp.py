@@ -0,0 +1,209 @@
+from numpy import asarray,full,empty,maximum,minimum,zeros,inf,isinf,isin,argmax,argmin,unravel_index,prod,flatnonzero,concatenate,arange,lexsort
+from time import time
+
+def is_integral(values) -> bool:
+    """True if all values are non-negative integers, which the dynamic programs below require for weights and capacities."""
+    values = asarray(values,dtype=float)
+    return bool((values >= 0).all() and (values == values.round()).all())
+
+def shift(table,axis:int,steps:int):
+    """Moves all entries of table by steps along axis. Entries that are moved out of range are dropped, new entries are infeasible."""
+    shifted = full(table.shape,-inf)
+    if steps < table.shape[axis]:
+        source,target = [slice(None)]*table.ndim,[slice(None)]*table.ndim
+        source[axis],target[axis] = slice(0,table.shape[axis]-steps),slice(steps,None)
+        shifted[tuple(target)] = table[tuple(source)]
+    return shifted
+
+def merge_flag(table):
+    """Moves all entries to flag 1 of the last axis, keeping the better one. Also returns where an entry came from flag 0."""
+    merged = full(table.shape,-inf)
+    merged[...,1] = maximum(table[...,0],table[...,1])
+    return merged, table[...,0] > table[...,1]
+
+def pack(sizes,values,capacity:int,counters=[],reference=None):
+    """Pseudo-polynomial DP for max sum(values*y) s.t. sum(sizes*y) <= capacity with binary y.
+    * counters: list of (item mask, axis size), the table also tracks how many items of each mask are packed. Counts above the axis size are dropped.
+    * reference: optional 0/1 vector, the table also tracks whether y differs from reference in at least one item.
+    Returns the final table over (exact size, counts, [differs]) and a function that maps a state of that table to the packed items."""
+    shape = [capacity+1]+[size for mask,size in counters]+([2] if reference is not None else [])
+    table = full(shape,-inf)
+    table[(0,)*len(shape)] = 0
+    taken,flag_sources = [],[]
+    for item in range(len(sizes)):
+        take = shift(table,0,int(sizes[item])) + values[item]
+        for axis,(mask,size) in enumerate(counters):
+            if mask[item]: take = shift(take,axis+1,1)
+        skip,take_source,skip_source = table,None,None
+        if reference is not None: # Taking or skipping an item differs from the reference solution
+            if reference[item]: skip,skip_source = merge_flag(skip)
+            else: take,take_source = merge_flag(take)
+        taken.append(take > skip)
+        flag_sources.append((take_source,skip_source))
+        table = maximum(take,skip)
+
+    def reconstruct(state):
+        state,solution = list(state),[]
+        for item in reversed(range(len(sizes))):
+            took = taken[item][tuple(state)]
+            source = flag_sources[item][0 if took else 1]
+            if source is not None and state[-1] == 1 and source[tuple(state[:-1])]: state[-1] = 0
+            if took:
+                solution.append(item)
+                state[0] -= int(sizes[item])
+                for axis,(mask,size) in enumerate(counters):
+                    if mask[item]: state[axis+1] -= 1
+        return sorted(solution)
+    return table, reconstruct
+
+def table_size(capacity,counters=[],reference=None) -> int:
+    """Number of states of a DP table, used to decide whether a DP is worth it."""
+    return int((capacity+1)*prod([size for mask,size in counters])*(2 if reference is not None else 1))
+
+def prepare(n:int,enforced_elements,disallowed_elements):
+    """Returns the items that are neither enforced nor disallowed, or False if an item is both."""
+    enforced,disallowed = set(enforced_elements),set(disallowed_elements)
+    if enforced & disallowed: return False
+    return [index for index in range(n) if index not in enforced and index not in disallowed]
+
+def fixed_items_differ(n:int,solution,enforced_elements,disallowed_elements) -> bool:
+    """True if enforced or disallowed elements already make every solution differ from the given one."""
+    in_solution = isin(range(n),solution)
+    return bool(in_solution[list(disallowed_elements)].any() or not in_solution[list(enforced_elements)].all())
+
+def best_state(table,allowed):
+    """Best state of a DP table among the allowed ones, or None if no allowed state is feasible."""
+    masked = full(table.shape,-inf)
+    masked[allowed] = table[allowed]
+    state = unravel_index(argmax(masked),masked.shape)
+    return None if isinf(masked[state]) else state
+
+def room_counters(n:int,free,enforced_elements,constrained_set):
+    """Counters for pack that keep the free items of each constrained set within the room left by the enforced elements, False if there is no room."""
+    counters = []
+    for item in constrained_set:
+        mask = zeros(n,dtype=bool)
+        mask[item['variables']] = True
+        room = item['rhs'] - mask[list(enforced_elements)].sum()
+        if room < 0: return False
+        counters.append((mask[free],int(min(room,mask[free].sum()))+1))
+    return counters
+
+def dp_solve_knapsack(weights,costs,b:int,enforced_elements=[],disallowed_elements=[],constrained_set=[],deviate_from_solution=[]):
+    """DP for a Knapsack instance with integer weights, same interface and side constraints as bip_solve_knapsack."""
+    start = time()
+    weights,costs = asarray(weights,dtype=float),asarray(costs,dtype=float)
+    free = prepare(len(weights),enforced_elements,disallowed_elements)
+    capacity = int(b - weights[list(enforced_elements)].sum())
+    if free == False or capacity < 0: return False
+    counters = room_counters(len(weights),free,enforced_elements,constrained_set)
+    if counters == False: return False
+    reference = None
+    if deviate_from_solution != [] and not fixed_items_differ(len(weights),deviate_from_solution,enforced_elements,disallowed_elements):
+        reference = isin(range(len(weights)),deviate_from_solution)[free]
+
+    table,reconstruct = pack(weights[free],costs[free],capacity,counters=counters,reference=reference)
+    state = best_state(table,(Ellipsis,1) if reference is not None else Ellipsis)
+    if state is None: return False
+    solution = sorted([free[item] for item in reconstruct(state)]+list(enforced_elements))
+    return solution, int(table[state]+costs[list(enforced_elements)].sum()), time()-start
+
+def dp_solve_cover(weights,costs,b:int,enforced_elements=[],disallowed_elements=[],constrained_set=[],deviate_from_solution=[],cover_set=[]):
+    """DP for a Cover instance with integer weights, same interface and side constraints as bip_solve_cover.
+    Solved as a Knapsack over the items that are left out, which have a total weight of at most the free weight minus b."""
+    start = time()
+    weights,costs = asarray(weights,dtype=float),asarray(costs,dtype=float)
+    free = prepare(len(weights),enforced_elements,disallowed_elements)
+    if free == False: return False,False,False
+    capacity = int(weights[free].sum() - (b - weights[list(enforced_elements)].sum()))
+    if capacity < 0: return False,False,False
+    counters,allowed = [],[slice(None)] # Left out items per set are tracked, x <= rhs becomes a lower bound, x >= rhs an upper bound on them
+    for item,sense in [(item,'<=') for item in constrained_set]+[(item,'>=') for item in cover_set]:
+        mask = zeros(len(weights),dtype=bool)
+        mask[item['variables']] = True
+        rhs = item['rhs'] - mask[list(enforced_elements)].sum()
+        if sense == '<=':
+            counters.append((mask[free],int(mask[free].sum())+1))
+            allowed.append(slice(max(int(mask[free].sum()-rhs),0),None))
+            if rhs < 0: return False,False,False
+        else:
+            if rhs > mask[free].sum(): return False,False,False
+            counters.append((mask[free],int(max(mask[free].sum()-rhs,0))+1))
+            allowed.append(slice(None))
+    reference = None
+    if deviate_from_solution != [] and not fixed_items_differ(len(weights),deviate_from_solution,enforced_elements,disallowed_elements):
+        reference = ~isin(range(len(weights)),deviate_from_solution)[free] # Left out items differ from the solution if the solution contains them
+        allowed.append(1)
+
+    table,reconstruct = pack(weights[free],costs[free],capacity,counters=counters,reference=reference)
+    state = best_state(table,tuple(allowed))
+    if state is None: return False,False,False
+    left_out = set(free[item] for item in reconstruct(state))
+    solution = sorted([index for index in free if index not in left_out]+list(enforced_elements))
+    return solution, int(costs[free].sum()-table[state]+costs[list(enforced_elements)].sum()), time()-start
+
+def dp_seperate_minimal_inequality(weights,costs,b:int,favoured_domain_objective:int):
+    """DP for the separation problem with integer weights and non-negative costs, same interface as seperate_minimal_inequality.
+    A lightest cover never weighs b + max(weights) or more, since leaving out any item would keep it a cover, so only smaller weights are tracked."""
+    start = time()
+    weights,costs = asarray(weights,dtype=float),asarray(costs,dtype=float)
+    b = int(b)
+    capacity = int(b + max(weights.max(initial=0),1) - 1)
+    table,reconstruct = pack(weights,-costs,capacity) # Cheapest subset for every exact weight
+    covers = flatnonzero(-table[b:] <= favoured_domain_objective-1)
+    if len(covers) == 0: return False,False,False
+    return reconstruct((int(b+covers[0]),)), int(b+covers[0]), time()-start
+
+def dp_max_weight_per_cost(weights,costs,max_cost:int,enforced_elements=[],disallowed_elements=[],constrained_set=[]):
+    """Largest total weight of a solution with exactly cost c for every c from 0 to max_cost, -inf where no solution has that cost.
+    Costs have to be non-negative integers, the side constraints are those of dp_solve_knapsack."""
+    weights,costs = asarray(weights,dtype=float),asarray(costs,dtype=float)
+    result = full(max_cost+1,-inf)
+    free = prepare(len(weights),enforced_elements,disallowed_elements)
+    offset = int(costs[list(enforced_elements)].sum())
+    if free == False or offset > max_cost: return result
+    counters = room_counters(len(weights),free,enforced_elements,constrained_set)
+    if counters == False: return result
+    table,reconstruct = pack(costs[free],weights[free],max_cost-offset,counters=counters)
+    result[offset:] = table.reshape(max_cost-offset+1,-1).max(axis=1) + weights[list(enforced_elements)].sum()
+    return result
+
+def dp_solve_rcsp(distances,node_weights,demands,capacity,enforced_nodes=[],removed_nodes=[]):
+    """Label-setting DP for the RCSP of an SPPRCLIB instance, same interface as bip_solve_rcsp in rcsp.py. Paths lead from the first to the last node 
+    and only visit nodes in ascending order, so nodes are labelled in that order. The labels of a node are the demand and cost of its Pareto-optimal 
+    partial paths, a label is dropped if another one at the same node has at most its demand and at most its cost. Paths cannot skip enforced nodes.
+    Demands need not be integral, with integral demands every node has at most capacity+1 labels."""
+    start = time()
+    distances,node_weights,demands = asarray(distances,dtype=float),asarray(node_weights,dtype=float),asarray(demands,dtype=float)
+    n = len(demands)
+    enforced,removed = set(enforced_nodes)|{0,n-1},set(removed_nodes)
+    if enforced & removed or demands[0] > capacity: return False,False,False
+    label_demands,label_costs,label_nodes,label_parents = [demands[:1]],[node_weights[:1]],[zeros(1,dtype=int)],[full(1,-1)]
+    offsets = [0,1] # Labels of node i have the numbers offsets[i] to offsets[i+1]-1, parents refer to these numbers
+    first = 0 # Last enforced node so far, earlier nodes cannot be predecessors
+    for node in range(1,n):
+        demand,cost,parent = empty(0),empty(0),empty(0,dtype=int)
+        if node not in removed and offsets[node] > offsets[first]:
+            predecessors = concatenate(label_nodes[first:node])
+            demand = concatenate(label_demands[first:node]) + demands[node]
+            cost = concatenate(label_costs[first:node]) + distances[predecessors,node] + node_weights[node]
+            parent = arange(offsets[first],offsets[node])
+            order = lexsort((cost,demand))[:int((demand <= capacity).sum())] # Sorted by demand, then cost, without labels above the capacity
+            demand,cost,parent = demand[order],cost[order],parent[order]
+            pareto = cost < concatenate(([inf],minimum.accumulate(cost)[:-1])) # Cheaper than every label with at most the same demand
+            demand,cost,parent = demand[pareto],cost[pareto],parent[pareto]
+        label_demands.append(demand)
+        label_costs.append(cost)
+        label_nodes.append(full(len(demand),node))
+        label_parents.append(parent)
+        offsets.append(offsets[-1]+len(demand))
+        if node in enforced: first = node
+    if len(label_costs[-1]) == 0: return False,False,False
+    nodes,parents = concatenate(label_nodes),concatenate(label_parents)
+    label = offsets[-2] + int(argmin(label_costs[-1]))
+    objective = label_costs[-1].min()
+    path = []
+    while label != -1:
+        path.append(int(nodes[label]))
+        label = parents[label]
+    return path[::-1], int(round(objective)), time()-start
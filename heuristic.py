@@ -0,0 +1,61 @@
+from gurobipy import GRB
+from numpy import asarray,ceil,floor,clip,abs as absolute
+from solver import bip_solve_cover,is_cf
+
+def distance(new_weights,weights):
+    """ 1-norm distance of new weights to the original weights, as an int for integer weights like the objective of the CE subproblem."""
+    total = float(absolute(new_weights-weights).sum())
+    return int(total) if total.is_integer() else total
+
+def greedy_cf(weights,costs,b,strong:bool,enforced_elements=[],disallowed_elements=[],constrained_set=[],max_deviation=0.05,max_rounds=100) -> tuple[list,float]:
+    """ Primal heuristic for the CE subproblem. Keeps the favoured solution of the original weights feasible and moves weights within max_deviation
+    until is_cf accepts them: every counterexample is made infeasible by lowering the weights of its items, those outside the favoured solution first,
+    and the favoured solution is made feasible again by raising the weights of its other items as far as all earlier counterexamples stay infeasible.
+    Returns the new integer weights and their 1-norm distance to weights, or None and GRB.INFINITY if no CE is found within max_rounds counterexamples."""
+    weights = asarray(weights,dtype=float)
+    lower,upper = ceil(weights*(1-max_deviation)-1e-6),floor(weights*(1+max_deviation)+1e-6)
+    new_weights = clip(weights.round(),lower,upper)
+    solution,dummy,dummy = bip_solve_cover(weights,costs,b,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set)
+    if solution == False: return None, GRB.INFINITY
+    favoured,counterexamples = set(solution),[]
+
+    for counter in range(max_rounds):
+        cf_found, counterexample = is_cf(new_weights.astype(int).tolist(),costs,b,strong=strong,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set)
+        if cf_found: return new_weights.astype(int).tolist(), distance(new_weights,weights)
+        if counterexample == []: return None, GRB.INFINITY
+
+        # Make the counterexample infeasible, lowering raised weights before original ones
+        excess = new_weights[counterexample].sum() - (b-1)
+        for index in sorted(counterexample,key=lambda index:(index in favoured,new_weights[index] <= weights[index],lower[index]-new_weights[index])):
+            step = min(excess,new_weights[index]-lower[index])
+            new_weights[index] -= step
+            excess -= step
+            if excess <= 0: break
+
+        # Make the favoured solution feasible again with items outside the counterexample, without making an earlier counterexample feasible
+        counterexamples.append(counterexample)
+        shortfall = b - new_weights[list(favoured)].sum()
+        for index in sorted(favoured-set(counterexample),key=lambda index:new_weights[index]-upper[index]):
+            if shortfall <= 0: break
+            step = min([shortfall,upper[index]-new_weights[index]]+[b-1-new_weights[items].sum() for items in counterexamples if index in items])
+            new_weights[index] += max(step,0)
+            shortfall -= max(step,0)
+        if excess > 0 or shortfall > 0: return None, GRB.INFINITY
+    return None, GRB.INFINITY
+
+def improve_cf(weights,new_weights,costs,b,strong:bool,enforced_elements=[],disallowed_elements=[],constrained_set=[]) -> tuple[list,float]:
+    """ Local search for a CE of greedy_cf. Moves each changed weight back to its original value, or half way if that is no CE,
+    largest change first, and repeats until no move is accepted. Returns the new weights and their 1-norm distance to weights."""
+    weights,new_weights = asarray(weights,dtype=float),asarray(new_weights,dtype=float)
+    improved = True
+    while improved:
+        improved = False
+        for index in sorted(range(len(weights)),key=lambda index:-abs(new_weights[index]-weights[index])):
+            if abs(new_weights[index]-weights[index]) < 1: break
+            for value in [weights[index].round(),(new_weights[index]+weights[index].round())//2]:
+                candidate = new_weights.copy()
+                candidate[index] = value
+                if candidate[index] != new_weights[index] and is_cf(candidate.astype(int).tolist(),costs,b,strong=strong,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set)[0]:
+                    new_weights,improved = candidate,True
+                    break
+    return new_weights.astype(int).tolist(), distance(new_weights,weights)
@@ -0,0 +1,56 @@
+from IO import write_state,read_state
+from solver import fingerprint
+from os.path import join
+import json as j
+
+version = 1 # Cache files of another version are ignored
+
+class InstanceCache:
+    """ Results that runs on the same knapsack instance share, stored in one JSON file per instance in cache_dir:
+    * the nominal solution, as returned by bip_solve_cover
+    * c_min and c_max of find_bounds_for_c or bounds_for_c per favoured solution space and max_deviation
+    * all y cuts found so far. A cut sum(new weights over S) <= b-1 only depends on the costs of S and the capacity, it holds for every
+      candidate of a run from the threshold given by cut_valid_from. Runs recompute these thresholds for their own CE type and favoured solution space,
+      so cuts of weak and strong runs, of other favoured solution spaces and of other deviation limits can be reused.
+    The file name and its content are tied to the weights, costs and capacity, so a changed instance never reads stale entries."""
+    def __init__(self,weights,costs,capacity,cache_dir:str='cache'):
+        self.key = {'version':version,'weights':fingerprint(weights).hex(),'costs':fingerprint(costs).hex(),'capacity':int(capacity)}
+        self.n = len(weights)
+        self.filename = join(cache_dir,self.key['weights'][:16]+'_'+self.key['costs'][:16]+'_'+str(self.key['capacity'])+'.json')
+        self.nominal_solution,self.bounds,self.cuts = None,{},{} # Cuts are keyed by their set of items
+        stored = read_state(self.filename)
+        if stored != False and stored['key'] == self.key:
+            self.nominal_solution,self.bounds = stored['nominal'],stored['bounds']
+            for cut in stored['cuts']:
+                if all(0 <= item < self.n for item in cut): self.cuts[frozenset(cut)] = cut
+        self.new_entries = 0 # Entries added since the file was read or saved
+
+    def nominal(self,solve) -> tuple:
+        """ Returns the cached nominal solution, otherwise stores and returns solve()."""
+        if self.nominal_solution == None:
+            solution,objective,runtime = solve()
+            self.nominal_solution = [[int(item) for item in solution],objective,runtime]
+            self.new_entries += 1
+        return tuple(self.nominal_solution)
+
+    def c_bounds(self,enforced_elements,disallowed_elements,constrained_set,max_deviation,preprocessed:bool,solve) -> tuple:
+        """ Returns the cached c_min and c_max for a favoured solution space, otherwise stores and returns solve(). 
+        preprocessed tells bounds_for_c from find_bounds_for_c, whose bounds are kept apart."""
+        key = j.dumps([sorted(int(item) for item in enforced_elements),sorted(int(item) for item in disallowed_elements),[[sorted(int(index) for index in item['variables']),int(item['rhs'])] for item in constrained_set],float(max_deviation),preprocessed])
+        if key not in self.bounds:
+            self.bounds[key] = list(solve())
+            self.new_entries += 1
+        return tuple(self.bounds[key])
+
+    def add_cuts(self,cuts):
+        """ Adds the cuts of a run that are not cached yet."""
+        for cut in cuts:
+            if frozenset(cut) not in self.cuts:
+                self.cuts[frozenset(cut)] = [int(item) for item in cut]
+                self.new_entries += 1
+
+    def save(self):
+        """ Writes the cache file if there are new entries."""
+        if self.new_entries == 0: return
+        write_state({'key':self.key,'nominal':self.nominal_solution,'bounds':self.bounds,'cuts':list(self.cuts.values())},self.filename)
+        self.new_entries = 0
@@ -1,37 +1,125 @@
-from IO import kplib_reader,write_as_json
+from IO import kplib_store_reader,write_as_json,write_state,read_state
 from sys import argv
 from random import seed,sample
 from time import time
-from solver import bip_solve_cover,find_bounds_for_c,is_cf,solve_counterfactual_subproblem,counterfactual_lb
+from solver import bip_solve_cover,find_bounds_for_c,candidate_bounds,cut_valid_from,is_cf,CounterfactualSubproblem,CounterfactualLowerBound,cache_info,fingerprint
+from cut_pool import CutPool
+from instance_cache import InstanceCache
+from preprocessing import item_bounds,fixed_items,bounds_for_c
+from heuristic import greedy_cf,improve_cf
+from functools import partial
+from profiling import timed,profile_info,merge_profiles,start_trace,stop_trace,trace,event
 from statistics import mean
+from itertools import accumulate
+from multiprocessing import get_context
+from os import remove,makedirs
+from os.path import join,exists
 from gurobipy import GRB
+import gurobipy as gp
+import json as j
 
-def run_cf(weights,costs,capacity,strong:bool,enforced_elements=[],disallowed_elements=[],constrained_set=[],parameters=[],max_deviation=0.05,epsilon=0.001,timelimit=10*3600):
-    """ Determines a counterfactual explenation for mutable in a,b."""
-    solution,c_opt,runtime = bip_solve_cover(weights,costs,capacity)
+worker_instance = {} # Instance data of a worker process in the parallel candidate search, set once by init_worker
+
+def init_worker(weights,costs,capacity,strong,enforced_elements,disallowed_elements,constrained_set,max_deviation,timerlimit,version,max_cut_age,lazy,cover_bounds):
+    """ Builds the subproblem model of a worker process once, so that tasks only carry a candidate and the state of the search.
+    version is a shared counter of the state of the search. Gurobi keeps its default number of threads, since results can differ between thread counts."""
+    worker_instance['subproblem'] = CounterfactualSubproblem(weights,costs,capacity,strong,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set,max_deviation=max_deviation,max_cut_age=max_cut_age,lazy=lazy,item_bounds=cover_bounds)
+    worker_instance['timerlimit'],worker_instance['version'] = timerlimit,version
+
+def solve_candidate(current_obj_candidate,version,best_known_objective,start,cuts,ages):
+    """ Solves the CE subproblem for one objective candidate in a worker process, for the incumbent, cuts and cut ages of version of the search state.
+    Also returns the new cut ages, the time spent, the cache hits and misses, the profile and the subproblem stats in the worker. 
+    Returns None without solving if the state changed in the meantime, the candidate is then handed out again. A solve that is running then stops
+    after its current cut round."""
+    if worker_instance['version'].value != version: return None
+    subproblem = worker_instance['subproblem']
+    start_time,cache_start,profile_start = time(),cache_info(),profile_info()
+    subproblem.start,subproblem.abandon = start,lambda: worker_instance['version'].value != version
+    if ages != None: subproblem.set_cut_ages(ages)
+    new_weights,new_capacity,new_objective,runtime,cuts = subproblem.solve(current_obj_candidate,cuts,best_known_objective=best_known_objective,timerlimit=worker_instance['timerlimit'])
+    return new_weights,new_capacity,new_objective,cuts,subproblem.cut_ages() if ages != None else None,time()-start_time,cache_info(since=cache_start),profile_info(since=profile_start),subproblem.stats
+
+def checkpoint_key(weights,costs,capacity,strong:bool,enforced_elements,disallowed_elements,constrained_set,max_deviation,order,preprocessing,c_min,c_max) -> dict:
+    """ Identifies the instance and the parameters of a run, as they are stored in a checkpoint. Only a run with the same key resumes a checkpoint.
+    The checkpoint stores a position in the candidate list, so the key also contains the candidate range and how it was bounded."""
+    return j.loads(j.dumps({'weights':fingerprint(weights).hex(),'costs':fingerprint(costs).hex(),'capacity':int(capacity),'strong':strong,'enforced_elements':[int(item) for item in enforced_elements],
+                            'disallowed_elements':[int(item) for item in disallowed_elements],'constrained_set':constrained_set,'max_deviation':max_deviation,'order':order,
+                            'preprocessing':preprocessing,'c_min':int(c_min),'c_max':int(c_max)}))
+
+def run_cf(weights,costs,capacity,strong:bool,enforced_elements=[],disallowed_elements=[],constrained_set=[],parameters=[],max_deviation=0.05,epsilon=0.001,timelimit=10*3600,workers=1,nominal=None,trace_file=None,order="linear",max_cut_age=None,lazy=False,checkpoint_file=None,checkpoint_interval=600,resume=False,instance_cache=None,preprocessing=True,heuristic="greedy"):
+    """ Determines a counterfactual explenation for mutable in a,b.
+    nominal can pass an already computed result of bip_solve_cover for the nominal problem.
+    workers > 1 solves the objective candidates in a process pool. Each candidate is handed out with the current incumbent, cuts and cut ages, 
+    and results are committed in candidate order. Once a committed candidate improves the incumbent or changes the cuts or their ages, the candidates 
+    in flight are handed out again with the new state. A subproblem solve only depends on this state (see CounterfactualSubproblem), so the log is 
+    the same as in the sequential search, apart from times and the profile. With max_cut_age, every optimal solve changes the ages.
+    The log contains a profile of all model builds and solves by model name, see profiling.py, and the cut rounds and branch and bound nodes per candidate.
+    trace_file is an optional JSONL file that receives these events live.
+    order selects the order of the objective candidates:
+    * "linear" visits all candidates in ascending order
+    * "pruned" does the same, but skips candidates whose bound from candidate_bounds shows that they cannot improve on the incumbent
+    * "best-first" visits candidates by ascending bound and stops once the next bound reaches the incumbent. Cuts are only valid for candidates 
+      above a threshold (see cut_valid_from), so the subproblem relaxes cuts for smaller candidates and the LB only uses cuts that are valid for all remaining candidates.
+    Pruning only skips candidates that cannot improve on the incumbent, so all orders find a CE with the same objective.
+    Cuts are kept in a CutPool, which drops duplicates and cuts that are implied by other cuts. max_cut_age lets cuts that were not binding 
+    in that many solved candidates leave the subproblem model, see CounterfactualSubproblem. They stay in the pool and the LB.
+    lazy = True solves each candidate in a single branch and cut with is_cf in a callback instead of repeated solves, see CounterfactualSubproblem.
+    Progress is reported as events (see profiling.event), which are printed and written to the trace.
+    checkpoint_file is an optional JSON file that receives the state of the search whenever the incumbent improves and otherwise every checkpoint_interval 
+    seconds: the position in the candidates, the cuts, the incumbent, the LB, the elapsed time and the logs of all finished candidates. resume = True continues 
+    from this state if the checkpoint belongs to the same instance and parameters. The checkpoint is removed once the search ends.
+    instance_cache is an optional InstanceCache of the instance. It provides the nominal solution and the bounds of earlier runs, and its cuts are added 
+    to the cuts before the search, each valid from its threshold for this run (see cut_valid_from). The cuts of this run are added to the cache afterwards.
+    preprocessing = True bounds c_min and c_max by LP relaxations and greedy covers and only solves a MIP for them if these do not meet (see bounds_for_c). 
+    It also fixes the items that every CE solution contains or leaves out (see fixed_items), and the subproblem fixes further items for each candidate.
+    heuristic selects a primal heuristic that gives the search a first incumbent, so the cutoff and the pruning of candidates work from the start:
+    * "greedy" moves weights until they are a CE (see greedy_cf)
+    * "local-search" afterwards moves weights back as long as they stay a CE (see improve_cf)
+    * None starts without an incumbent"""
+    if trace_file != None: start_trace(trace_file)
+    if nominal == None: nominal = instance_cache.nominal(lambda: bip_solve_cover(weights,costs,capacity)) if instance_cache != None else bip_solve_cover(weights,costs,capacity)
+    solution,c_opt,runtime = nominal
     log = {} # This is used to log everything
     log['original_runtime'] = runtime
     starttime = time() # Used to measure timelimit
+    cache_start,profile_start = cache_info(),profile_info() # Used to count cache hits and misses and the profile of this run
+    worker_cache,worker_profile = {},{} # Cache hits and misses and profile in worker processes
 
     # preprocessing
-    c_min,c_max = find_bounds_for_c(weights,costs,capacity,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,max_deviation=max_deviation)
-    print("Beginning optimisation:\nPotential objective range for CE: c_min:",c_min,"c_max:",c_max,"c_opt",c_opt,"\n")
+    cover_bounds,fixed_in,fixed_out = None,[],[]
+    if preprocessing:
+        with timed("Preprocessing",phase=True):
+            cover_bounds = item_bounds(weights,costs,capacity,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,max_deviation=max_deviation)
+            fixed_in,fixed_out = fixed_items(weights,costs,capacity,cover_bounds,max_deviation=max_deviation)
+        log['fixed_in'],log['fixed_out'] = fixed_in,fixed_out
+        event('preprocessing',"Fixed",len(fixed_in),"items in and",len(fixed_out),"items out of all CE solutions.",fixed_in=len(fixed_in),fixed_out=len(fixed_out))
+        find_bounds = lambda: bounds_for_c(weights,costs,capacity,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set,max_deviation=max_deviation,fixed_in=fixed_in,fixed_out=fixed_out)
+    else:
+        find_bounds = lambda: find_bounds_for_c(weights,costs,capacity,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,max_deviation=max_deviation)
+    with timed("find_bounds_for_c",phase=True): c_min,c_max = instance_cache.c_bounds(enforced_elements,disallowed_elements,constrained_set,max_deviation,preprocessing,find_bounds) if instance_cache != None else find_bounds()
+    event('bounds',"Beginning optimisation:\nPotential objective range for CE: c_min:",c_min,"c_max:",c_max,"c_opt",c_opt,"\n",c_min=c_min,c_max=c_max,c_opt=c_opt)
     log['c_min'] = c_min
     log['c_max'] = c_max
     log['n_subproblems'] = c_max-c_min
+    log['order'] = order
     incumbent_objective = GRB.INFINITY
 
     lb = 0
     lb_time = 0
-    cuts = [] # format: [[indices to include in cut],[...]]
+    cached_cuts = list(instance_cache.cuts.values()) if instance_cache != None else [] # Their thresholds depend on this run, so the pool tracks them
+    cuts = CutPool(valid_from=partial(cut_valid_from,costs=costs,strong=strong,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set) if order == "best-first" or cached_cuts != [] else None) # Iterates like [[indices to include in cut],[...]]
+    for cut in cached_cuts: cuts.append(cut)
+    log['cached_cuts'] = len(cuts)
     iterationcounter = 0
+    pruned = 0 # Candidates skipped because of their bound
     incumbents,lbs = {},{}
     time_per_iteration = {}
+    rounds_per_iteration,nodes_per_iteration = {},{} # Cut rounds and branch and bound nodes of the CE subproblem
 
     cf_found, solution = is_cf(weights,costs,capacity,strong=strong,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set)
     
     if cf_found:
-        print("Solution was already CE: CE found:",cf_found,"with objective",solution)
+        event('already_ce',"Solution was already CE: CE found:",cf_found,"with objective",solution)
         log['solution'] = "Solution was already CF with cost 0."
         incumbent_objective = 0
         incumbent_weights = list(weights)
@@ -40,48 +128,152 @@ def run_cf(weights,costs,capacity,strong:bool,enforced_elements=[],disallowed_el
         # variables
         incumbent_weights,incumbent_capacity,incumbent_objective = None,None,GRB.INFINITY
 
+        # Continue from a checkpoint of an earlier attempt of this run
+        key = checkpoint_key(weights,costs,capacity,strong,enforced_elements,disallowed_elements,constrained_set,max_deviation,order,preprocessing,c_min,c_max)
+        start_position,last_checkpoint = 0,time()
+        state = read_state(checkpoint_file) if resume and checkpoint_file != None else False
+        if state != False and state['key'] == key:
+            start_position,starttime = state['position'],time()-state['elapsed']
+            for cut in state['cuts']: cuts.append(cut)
+            cuts.dominated = state['dominated_cuts']
+            incumbent_weights,incumbent_capacity,incumbent_objective = state['incumbent_weights'],state['incumbent_capacity'],state['incumbent_objective']
+            lb,lb_time,iterationcounter,pruned = state['lb'],state['lb_time'],state['iterationcounter'],state['pruned']
+            incumbents,lbs,time_per_iteration,rounds_per_iteration,nodes_per_iteration = [{int(candidate):value for candidate,value in state[name].items()} for name in ['incumbents','lbs','time_per_iteration','rounds_per_iteration','nodes_per_iteration']]
+            log['resumed_from_position'] = start_position
+            event('resume',"Resuming at position",start_position,"after",round(state['elapsed'],2),"s with",len(cuts),"cuts and incumbent",incumbent_objective,position=start_position,elapsed=state['elapsed'])
+        elif state != False:
+            event('resume',"Checkpoint",checkpoint_file,"belongs to another instance or other parameters, starting from scratch.",position=0)
+
+        def save_checkpoint(position:int):
+            """ Writes the state of the search before the candidate at position to the checkpoint file."""
+            write_state({'key':key,'position':position,'elapsed':time()-starttime,'cuts':list(cuts),'dominated_cuts':cuts.dominated,
+                              'incumbent_weights':incumbent_weights,'incumbent_capacity':incumbent_capacity,'incumbent_objective':incumbent_objective,
+                              'lb':lb,'lb_time':lb_time,'iterationcounter':iterationcounter,'pruned':pruned,'incumbents':incumbents,'lbs':lbs,
+                              'time_per_iteration':time_per_iteration,'rounds_per_iteration':rounds_per_iteration,'nodes_per_iteration':nodes_per_iteration},checkpoint_file)
+            event('checkpoint',position=position,total_cuts=len(cuts))
+
+        # A first incumbent from the primal heuristic
+        if heuristic != None and incumbent_objective == GRB.INFINITY:
+            heuristic_start = time()
+            with timed("Heuristic",phase=True):
+                heuristic_weights,heuristic_objective = greedy_cf(weights,costs,capacity,strong,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set,max_deviation=max_deviation)
+                if heuristic == "local-search" and heuristic_weights != None:
+                    heuristic_weights,heuristic_objective = improve_cf(weights,heuristic_weights,costs,capacity,strong,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set)
+            log['heuristic_objective'],log['heuristic_time'] = heuristic_objective,time()-heuristic_start
+            if heuristic_weights != None:
+                incumbent_weights,incumbent_capacity,incumbent_objective = heuristic_weights,capacity,heuristic_objective
+                event('heuristic',"Heuristic found a CE with objective",heuristic_objective,"in",round(log['heuristic_time'],2),"s",objective=heuristic_objective,seconds=log['heuristic_time'])
+            else:
+                event('heuristic',"Heuristic found no CE in",round(log['heuristic_time'],2),"s",objective=None,seconds=log['heuristic_time'])
+
+        # One subproblem model is kept for the whole search, in the parallel search each worker keeps its own
+        pool,pending,ages = None,{},None
+        if workers > 1:
+            context = get_context("spawn")
+            version = context.Value('i',0) # Counts the changes of the incumbent, the cuts and their ages
+            ages = (0,{},set()) if max_cut_age != None else None # cut_ages of a new subproblem
+            pool = context.Pool(workers,initializer=init_worker,initargs=(weights,costs,capacity,strong,enforced_elements,disallowed_elements,constrained_set,max_deviation,starttime+timelimit,version,max_cut_age,lazy,cover_bounds))
+        else:
+            subproblem = CounterfactualSubproblem(weights,costs,capacity,strong,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set,max_deviation=max_deviation,max_cut_age=max_cut_age,lazy=lazy,item_bounds=cover_bounds)
+
+        def dispatch(candidate:int):
+            """ Hands a candidate to the pool with the current state of the search."""
+            pending[candidate] = pool.apply_async(solve_candidate,(candidate,version.value,incumbent_objective,incumbent_weights,cuts,ages))
+
+        covering_items = sorted(set(range(len(weights)))-set(disallowed_elements)-set(fixed_out)) if preprocessing else None
+        lower_bound = CounterfactualLowerBound(weights,capacity,max_deviation=max_deviation,covering_items=covering_items)
+
+        # Candidates are visited in this order, those with a bound of at least the incumbent objective are pruned
+        candidates,bounds = list(range(c_min,c_max+1)),{}
+        if order != "linear":
+            bounds = candidate_bounds(weights,costs,capacity,c_min,c_max,enforced_elements=sorted(set(enforced_elements)|set(fixed_in)),disallowed_elements=sorted(set(disallowed_elements)|set(fixed_out)),constrained_set=constrained_set,max_deviation=max_deviation)
+            if order == "best-first": candidates.sort(key=lambda candidate:(bounds[candidate],candidate))
+        smallest_remaining = list(accumulate(reversed(candidates[1:]+[GRB.INFINITY]),min))[::-1] # Smallest candidate after each position
+        valid_cuts = lambda smallest: [cut for cut in cuts if cuts.thresholds[frozenset(cut)] <= smallest] if cuts.valid_from != None else cuts # Cuts that are valid for all candidates from smallest on
+
+        if len(cuts) > 0 and start_position < len(candidates): # Cuts from the instance cache or a checkpoint already bound the first candidate
+            lb_start = time()
+            lb = max(lb,lower_bound.solve(valid_cuts(min(candidates[start_position:])))[0])
+            lb_time += time() - lb_start
+
         # This is the main iteration
-        for current_obj_candidate in range(c_min,c_max+1): 
+        next_position = start_position
+        for position,current_obj_candidate in enumerate(candidates[start_position:],start_position): 
             if time() - starttime > timelimit:
-                print(int(iterationcounter/(c_max-c_min)*100),r"% of values searched before timelimit.")
+                event('timelimit',int(position/max(c_max-c_min,1)*100),r"% of values searched before timelimit.",position=position)
                 log['timelimit'] = True
                 break
+            if bounds.get(current_obj_candidate,0) >= incumbent_objective: # The candidate cannot improve on the incumbent
+                pending.pop(current_obj_candidate,None)
+                if order == "best-first": # Neither can any later one
+                    pruned += len(candidates)-position
+                    break
+                pruned += 1
+                continue
 
             iterationcounter += 1
             start = time()
             if incumbent_objective != GRB.INFINITY:
-                print(current_obj_candidate,current_obj_candidate-c_min,"out of",c_max-c_min,"Incumbent:",int(incumbent_objective),"LB:",int(lb))
+                event('solving',current_obj_candidate,position,"out of",c_max-c_min,"Incumbent:",int(incumbent_objective),"LB:",int(lb),candidate=current_obj_candidate,position=position)
             else:
-                print(current_obj_candidate,current_obj_candidate-c_min,"out of",c_max-c_min,"No Incumbent. LB:",int(lb))
+                event('solving',current_obj_candidate,position,"out of",c_max-c_min,"No Incumbent. LB:",int(lb),candidate=current_obj_candidate,position=position)
         
             # Solve CF problem
-            new_weights,new_capacity,new_objective,runtime,cuts = solve_counterfactual_subproblem(weights,costs,capacity,current_obj_candidate,strong,cuts,best_known_objective=incumbent_objective,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set,timerlimit=starttime+timelimit)
-            
+            if pool == None:
+                subproblem.start = incumbent_weights
+                new_weights,new_capacity,new_objective,runtime,cuts = subproblem.solve(current_obj_candidate,cuts,best_known_objective=incumbent_objective,timerlimit=starttime+timelimit)
+                stats,changed = subproblem.stats,False
+            else:
+                while next_position < min(len(candidates),position+workers): # Keep every worker busy with the next candidates that are not pruned yet
+                    if bounds.get(candidates[next_position],0) < incumbent_objective: dispatch(candidates[next_position])
+                    next_position += 1
+                new_weights,new_capacity,new_objective,new_cuts,new_ages,worker_time,cache_counts,profile,stats = pending.pop(current_obj_candidate).get()
+                for name in cache_counts: worker_cache[name] = {count:worker_cache.get(name,{}).get(count,0)+cache_counts[name][count] for count in cache_counts[name]}
+                merge_profiles(worker_profile,profile)
+                start = time() - worker_time # The subproblem was solved in the worker, so the iteration is timed from there
+                changed = stats['cuts'] > 0 or new_ages != ages or new_objective < incumbent_objective
+                cuts,ages = new_cuts,new_ages # The candidate was solved for the current state, so its cuts are those of the sequential search
+
             # Solve LB problem based on CF cuts
             lb_start = time()
-            lb_new,lb_runtime = counterfactual_lb(weights,capacity,cuts=cuts,max_deviation=max_deviation)
-            lb_time += lb_start - time()
+            lb_new,lb_runtime = lower_bound.solve(valid_cuts(smallest_remaining[position])) # Only solves if the candidate added new cuts
+            lb_time += time() - lb_start
 
             # Track optimality status
             if lb_new > lb: 
                 lb = lb_new 
                 lbs[current_obj_candidate] = lb
-            if new_objective < incumbent_objective: 
-                print("    Found new incumbent at ",current_obj_candidate," with objective",new_objective,", LB",lb,"\n")
-                print("    New weights:",new_weights)
+            improved = new_objective < incumbent_objective
+            if improved: 
+                event('incumbent',"    Found new incumbent at ",current_obj_candidate," with objective",new_objective,", LB",lb,"\n    New weights:",new_weights,candidate=current_obj_candidate,objective=new_objective,lb=lb,weights=new_weights)
                 incumbent_weights,incumbent_capacity,incumbent_objective = new_weights,new_capacity,new_objective
                 incumbents[current_obj_candidate] = new_objective
 
+            if changed: # Candidates in flight were handed out with an older state
+                version.value += 1
+                for candidate in pending: dispatch(candidate)
+
             # Track time
             time_per_iteration[current_obj_candidate] = time() -start
+            rounds_per_iteration[current_obj_candidate],nodes_per_iteration[current_obj_candidate] = stats['rounds'],stats['nodes']
+            trace('candidate',candidate=current_obj_candidate,seconds=time_per_iteration[current_obj_candidate],incumbent=incumbent_objective,lb=lb,total_cuts=len(cuts),**stats)
+            if checkpoint_file != None and (improved or time() - last_checkpoint >= checkpoint_interval):
+                save_checkpoint(position+1)
+                last_checkpoint = time()
         
             # Check termination criteria
             if incumbent_objective <= lb + epsilon: 
                 if incumbent_objective == 0:
-                    print("Found final CF solution with objective 0, stopped search.",incumbent_weights,incumbent_capacity,incumbent_objective)
+                    event('finished',"Found final CF solution with objective 0, stopped search.",incumbent_weights,incumbent_capacity,incumbent_objective,objective=incumbent_objective,lb=lb)
                 else:
-                    print("Found final CF solution with objective",incumbent_objective,"current LB is",lb_new)
+                    event('finished',"Found final CF solution with objective",incumbent_objective,"current LB is",lb_new,objective=incumbent_objective,lb=lb)
                 break
+
+        if pool != None: pool.terminate() # Candidates still in the pool cannot improve on the final incumbent
+        if checkpoint_file != None and exists(checkpoint_file): remove(checkpoint_file)
+    if instance_cache != None:
+        instance_cache.add_cuts(cuts)
+        instance_cache.save()
     
     # Log all potentially important information
     if incumbent_objective != GRB.INFINITY and 'timelimit' not in log: log['solved'] = True
@@ -90,91 +282,137 @@ def run_cf(weights,costs,capacity,strong:bool,enforced_elements=[],disallowed_el
     log['Final_UB'] = incumbent_objective
     log['Final_LB'] = lb
     log['total_iterations'] = iterationcounter
+    log['pruned_candidates'] = pruned
     if incumbent_weights != None:
         log['final_solution_weights'] = list(incumbent_weights)
         log['final_solution_delta'] = [incumbent_weights[index]-weights[index] for index in range(len(incumbent_weights))] # This is the deviation from the original weights
         log['final_solution_capacity'] = incumbent_capacity
         log['incumbents'] = incumbents
     log['lbs'] = lbs
-    log['cuts'] = cuts
+    log['cuts'] = list(cuts)
+    log['dominated_cuts'] = cuts.dominated
     log['total_time_for_LBs'] = lb_time
     log['time_per_iteration_in_s'] = time_per_iteration
+    log['cache'] = cache_info(since=cache_start)
+    for name in worker_cache: log['cache'][name] = {count:log['cache'][name][count]+worker_cache[name][count] for count in worker_cache[name]}
+    log['rounds_per_iteration'] = rounds_per_iteration
+    log['nodes_per_iteration'] = nodes_per_iteration
+    log['profile'] = merge_profiles(profile_info(since=profile_start),worker_profile)
+    if trace_file != None: stop_trace()
 
     return log
 
-if __name__ == "__main__": 
-    # Example execution: python3 main.py 'uncorrelated' 10 'p' 0.05 12 strong
-    # Meaning: python3 main.py [instance type] [instance size] [favoured solution space] [size of mutable parameter space] [instance index] [CE type]
-    # [instance type]: "strongly_correlated" and "uncorrelated"
-    # [instance size]: 50, 100, 200, 500, 1000, 2000, 5000, 10000
-    # [favoured solution space]:
-    # * p positive fixations
-    # * n negative fixations
-    # * c constraint fixations 
-    # combinations are possible
-    # [size of mutable parameter space]: between 0 and 1, e.g. 0.05 for 5%
-    # [instance index]: between 1 and 10
-    # [CE type]: 'strong' or any other string for weak CEs
-
-    # parameters
-    seed(0) # Hardcoded, if you change this, change the logging as well => tracked_data
-    epsilon = 0.01
-    if argv[6] == 'strong':
-        strong = True
-    else:
-        strong = False
-    favoured_solution_space_type = argv[3]
-    mutable_parameter_space_size = float(argv[4])
-    instance_index = int(argv[5])
-
-    if len(favoured_solution_space_type) > 1 and strong:
-        print("ERROR: Strong CFs with multiple favoured solution space types are not supported. Please choose only one of p, n or c.")
-
-    # This captures all relevant data
-    tracked_data = {"input":{'instance_type':argv[1],'instance_size':argv[2],'favoured_solution_space_types':argv[3],'mutable_parameter_space_size':argv[4],'instance_index':instance_index},"Is strong?":strong,"parameters":{"epsilon":epsilon,'strong':strong,'seed':0}}
-    
-    # Read in data
-    if int(argv[2]) < 50:
-        weights, costs, capacity = kplib_reader(argv[1], 50, 1000,instance_index)
-        weights = weights[:int(argv[2])]
-        costs = costs[:int(argv[2])]
-        capacity = int(capacity*int(argv[2])/50)
+def load_instance(instance_type:str,instance_size:int,instance_index:int):
+    """ Reads a kplib instance. Sizes below 50 use the first items of the size 50 instance and a proportionally scaled capacity."""
+    if instance_size < 50:
+        weights, costs, capacity = kplib_store_reader(instance_type, 50, 1000,instance_index)
+        weights = weights[:instance_size]
+        costs = costs[:instance_size]
+        capacity = int(capacity*instance_size/50)
     else:
-        weights, costs, capacity = kplib_reader(argv[1], int(argv[2]), 1000,instance_index)
+        weights, costs, capacity = kplib_store_reader(instance_type, instance_size, 1000,instance_index)
+    return weights, costs, capacity
 
-    # We begin with computing a nominal solution
-    solution,objective,dummy = bip_solve_cover(weights,costs,capacity) 
-    print("\nSolved nominal problem\nNominal solution has objective",objective,"with items",solution,"and costs",costs)
+def result_name(instance_type,instance_size,favoured_solution_space_type,mutable_parameter_space_size,instance_index,ce_type) -> str:
+    """ Name of the results file of an experiment, without the .json ending."""
+    return str(instance_index)+'_'+str(instance_type)+'_'+str(instance_size)+'_1000_'+str(favoured_solution_space_type)+'_'+str(mutable_parameter_space_size)+'_'+str(ce_type)
 
+def favoured_solution_space(weights,capacity,solution,favoured_solution_space_type:str):
+    """ Samples the favoured solution space of an experiment around the nominal solution, call seed(0) first to reproduce the study.
+    Returns the enforced elements, the disallowed elements and the constrained set."""
     # randomised enforcing of elements
     if 'p' in favoured_solution_space_type:
         enforced_elements = sample([item for item in range(len(weights)) if item not in solution],max(round(capacity/mean(weights)/10),1))
-        print("Enforcing elements",enforced_elements,"\n")
+        event('favoured_solution_space',"Enforcing elements",enforced_elements,"\n",enforced_elements=enforced_elements)
     else:
         enforced_elements = []    
-    tracked_data['enforced_elements'] = enforced_elements
 
     # randomised disallowal of elements
     if 'n' in favoured_solution_space_type:
         disallowed_elements = sample([item for item in range(len(weights)) if item not in enforced_elements if item in solution],max(round(capacity/mean(weights)/10),1))
-        print("Disallowing elements",disallowed_elements,"\n")
+        event('favoured_solution_space',"Disallowing elements",disallowed_elements,"\n",disallowed_elements=disallowed_elements)
     else:
         disallowed_elements = []
-    tracked_data['disallowed_elements'] = disallowed_elements
 
     # randomised constraints on elements
     if 'c' in favoured_solution_space_type:
         constrained_set = [{'variables':sample([item for item in range(len(weights))],max(round(len(weights)/10),1)),'rhs':1}]
-        print("Constraints on", constrained_set," / pick at least one.\n")
+        event('favoured_solution_space',"Constraints on", constrained_set," / pick at least one.\n",constrained_set=constrained_set)
     else:
         constrained_set = []
+    return enforced_elements,disallowed_elements,constrained_set
+
+def run_experiment(instance_type,instance_size,favoured_solution_space_type,mutable_parameter_space_size,instance_index,ce_type,epsilon=0.01,timelimit=10*3600,workers=1,instance=None,nominal=None,trace_file=None,order="linear",max_cut_age=None,lazy=False,checkpoint_dir=None,resume=False,cache_dir=None,preprocessing=True,heuristic="greedy"):
+    """ Runs one experiment of the computational study, the parameters are those of the command line (see below).
+    instance = (weights,costs,capacity) and nominal = bip_solve_cover result of the nominal problem can be passed to reuse them across experiments.
+    trace_file, order, max_cut_age, lazy, resume, preprocessing and heuristic are passed on to run_cf.
+    checkpoint_dir is an optional folder for the checkpoint of the run, [results name].checkpoint.json. Without a trace_file, the events of the run 
+    are also written to [results name].events.jsonl there, which a run that does not resume starts anew.
+    cache_dir is an optional folder for the InstanceCache of the instance, which is shared by all runs on it.
+    Returns the tracked data and the name of the results file."""
+    seed(0) # Hardcoded, if you change this, change the logging as well => tracked_data
+    strong = ce_type == 'strong'
+    mutable_parameter_space_size,instance_index = str(mutable_parameter_space_size),int(instance_index)
+
+    # This captures all relevant data
+    tracked_data = {"input":{'instance_type':instance_type,'instance_size':str(instance_size),'favoured_solution_space_types':favoured_solution_space_type,'mutable_parameter_space_size':mutable_parameter_space_size,'instance_index':instance_index},"Is strong?":strong,"parameters":{"epsilon":epsilon,'strong':strong,'seed':0,'order':order}}
+    
+    # Events of the run go to the trace file, or to the events file of the run in checkpoint_dir
+    name = result_name(instance_type,instance_size,favoured_solution_space_type,mutable_parameter_space_size,instance_index,ce_type)
+    checkpoint_file = join(checkpoint_dir,name+'.checkpoint.json') if checkpoint_dir != None else None
+    if checkpoint_dir != None: makedirs(checkpoint_dir,exist_ok=True)
+    if trace_file != None: start_trace(trace_file) # run_cf continues it
+    elif checkpoint_dir != None: start_trace(join(checkpoint_dir,name+'.events.jsonl'),records=False,append=resume)
+
+    if len(favoured_solution_space_type) > 1 and strong:
+        event('error',"ERROR: Strong CFs with multiple favoured solution space types are not supported. Please choose only one of p, n or c.")
+
+    # Read in data
+    weights, costs, capacity = instance if instance != None else load_instance(instance_type,int(instance_size),instance_index)
+
+    # We begin with computing a nominal solution
+    instance_cache = InstanceCache(weights,costs,capacity,cache_dir) if cache_dir != None else None
+    if nominal == None: nominal = instance_cache.nominal(lambda: bip_solve_cover(weights,costs,capacity)) if instance_cache != None else bip_solve_cover(weights,costs,capacity)
+    solution,objective,dummy = nominal
+    event('nominal',"\nSolved nominal problem\nNominal solution has objective",objective,"with items",solution,"and costs",costs,objective=objective,items=solution)
+
+    enforced_elements,disallowed_elements,constrained_set = favoured_solution_space(weights,capacity,solution,favoured_solution_space_type)
+    tracked_data['enforced_elements'] = enforced_elements
+    tracked_data['disallowed_elements'] = disallowed_elements
     tracked_data['constrained_set'] = constrained_set
 
     timer = time()
-    result = run_cf(weights,costs,capacity,strong=strong,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set,max_deviation=mutable_parameter_space_size,epsilon=epsilon)
+    result = run_cf(weights,costs,capacity,strong=strong,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set,max_deviation=float(mutable_parameter_space_size),epsilon=epsilon,timelimit=timelimit,workers=workers,nominal=nominal,trace_file=trace_file,order=order,max_cut_age=max_cut_age,lazy=lazy,checkpoint_file=checkpoint_file,resume=resume,instance_cache=instance_cache,preprocessing=preprocessing,heuristic=heuristic)
+    stop_trace()
     tracked_data['result'] = result
-    tracked_data['total_runtime_in_s'] = time()-timer
-    name = str(instance_index)+'_'+str(argv[1])+'_'+str(argv[2])+'_1000_'+str(argv[3])+'_'+str(argv[4])+'_'+str(argv[6])
+    tracked_data['total_runtime_in_s'] = time()-timer # Of this attempt only, if the run was resumed
     tracked_data['instance'] = {'weights':list(weights),'costs':list(costs),'capacity':capacity}
+    return tracked_data, name
+
+if __name__ == "__main__": 
+    # Example execution: python3 main.py 'uncorrelated' 10 'p' 0.05 12 strong
+    # Meaning: python3 main.py [instance type] [instance size] [favoured solution space] [size of mutable parameter space] [instance index] [CE type]
+    # [instance type]: "strongly_correlated" and "uncorrelated"
+    # [instance size]: 50, 100, 200, 500, 1000, 2000, 5000, 10000
+    # [favoured solution space]:
+    # * p positive fixations
+    # * n negative fixations
+    # * c constraint fixations 
+    # combinations are possible
+    # [size of mutable parameter space]: between 0 and 1, e.g. 0.05 for 5%
+    # [instance index]: between 1 and 10
+    # [CE type]: 'strong' or any other string for weak CEs
+    # Optionally, a seventh argument sets the number of worker processes for the candidate search, e.g. 8. Default is 1 (sequential).
+    # An optional eighth argument is a JSONL file that receives a live trace of all model builds, solves and candidates, e.g. trace.jsonl.
+    # Options can be given anywhere in the arguments:
+    # --checkpoint-dir=runs checkpoints the run to runs/[results name].checkpoint.json and, without a trace file, writes its progress to runs/[results name].events.jsonl.
+    # --resume continues from that checkpoint after a crash or kill, otherwise a new events file is started.
+    # --cache-dir=cache shares the nominal solution, bounds and cuts of the instance with other runs through cache/.
+    # To run many experiments at once, see batch.py.
+    options = dict(argument[2:].partition('=')[::2] for argument in argv if argument.startswith('--'))
+    argv = [argument for argument in argv if not argument.startswith('--')]
+    workers = int(argv[7]) if len(argv) > 7 else 1
+    trace_file = argv[8] if len(argv) > 8 else None
+    tracked_data, name = run_experiment(argv[1],argv[2],argv[3],argv[4],argv[5],argv[6],workers=workers,trace_file=trace_file,checkpoint_dir=options.get('checkpoint-dir'),resume='resume' in options,cache_dir=options.get('cache-dir'))
     write_as_json(tracked_data,name)
-    print("Finished execution for instance",name)
\ No newline at end of file
+    print("Finished execution for instance",name)
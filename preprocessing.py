@@ -0,0 +1,99 @@
+from gurobipy import GRB
+from numpy import asarray,argsort,cumsum,interp,isin,where,ceil,floor,flatnonzero,inf
+from solver import bip_solve_cover,find_bounds_for_c,in_favoured_domain
+from dp import is_integral
+
+def cover_order(weights,costs,enforced_elements=[],disallowed_elements=[]):
+    """ Free items with positive weight by ascending cost per weight, the order in which the LP relaxation of a cover problem takes them,
+    together with the prefix sums of their weights and costs."""
+    free = flatnonzero(~isin(range(len(weights)),list(enforced_elements)+list(disallowed_elements)) & (weights > 0))
+    order = free[argsort(costs[free]/weights[free],kind='stable')]
+    return order,cumsum([0.0]+list(weights[order])),cumsum([0.0]+list(costs[order]))
+
+def relaxed_cover(weights,costs,b,enforced_elements=[],disallowed_elements=[]) -> float:
+    """ Objective of the LP relaxation of bip_solve_cover, GRB.INFINITY if all allowed items together do not cover b.
+    Constrained sets are relaxed, costs have to be non-negative."""
+    weights,costs = asarray(weights,dtype=float),asarray(costs,dtype=float)
+    order,cum_weights,cum_costs = cover_order(weights,costs,enforced_elements,disallowed_elements)
+    rest,offset = b - weights[list(enforced_elements)].sum(),costs[list(enforced_elements)].sum()
+    if rest <= 0: return offset
+    if rest > cum_weights[-1] + 1e-9: return GRB.INFINITY
+    return offset + interp(rest,cum_weights,cum_costs)
+
+def greedy_cover(weights,costs,b,enforced_elements=[],disallowed_elements=[],constrained_set=[]) -> tuple[list,float]:
+    """ Feasible solution of bip_solve_cover, which adds items by ascending cost per weight and then drops the most expensive ones that are not needed.
+    A single item that covers the rest of b on its own is taken instead if it is cheaper. Returns False and GRB.INFINITY if no cover is found."""
+    weights,costs = asarray(weights,dtype=float),asarray(costs,dtype=float)
+    order,dummy,dummy = cover_order(weights,costs,enforced_elements,disallowed_elements)
+    solution,total = list(enforced_elements),weights[list(enforced_elements)].sum()
+    counts = [len(set(item['variables']) & set(solution)) for item in constrained_set]
+    for index in order:
+        if total >= b: break
+        if any(index in item['variables'] and count >= item['rhs'] for item,count in zip(constrained_set,counts)): continue
+        solution.append(int(index))
+        total += weights[index]
+        counts = [count + (index in item['variables']) for item,count in zip(constrained_set,counts)]
+    if total < b: return False, GRB.INFINITY
+    for index in sorted(set(solution)-set(enforced_elements),key=lambda index:-costs[index]):
+        if total - weights[index] >= b:
+            solution.remove(index)
+            total -= weights[index]
+    rest = b - weights[list(enforced_elements)].sum()
+    singles = [int(index) for index in order if weights[index] >= rest and in_favoured_domain(list(enforced_elements)+[index],constrained_set=constrained_set)]
+    if rest > 0 and singles != []:
+        single = min(singles,key=lambda index:costs[index])
+        if costs[single] < costs[solution].sum() - costs[list(enforced_elements)].sum(): solution = list(enforced_elements)+[single]
+    return sorted(solution), costs[solution].sum()
+
+def item_bounds(weights,costs,b,enforced_elements=[],disallowed_elements=[],max_deviation=0.05):
+    """ Lower bounds on the cost of all favoured covers without and with each free item, for all weights and capacities within max_deviation.
+    Both come from the LP relaxation under the largest weights and the smallest capacity, which is evaluated for all items at once.
+    Returns the items and both bounds as arrays, or None if costs are negative."""
+    weights,costs = asarray(weights,dtype=float),asarray(costs,dtype=float)
+    if len(costs) == 0 or min(costs) < 0: return None
+    heaviest = weights*(1+max_deviation)
+    order,cum_weights,cum_costs = cover_order(heaviest,costs,enforced_elements,disallowed_elements)
+    rest,offset = b*(1-max_deviation) - heaviest[list(enforced_elements)].sum(),costs[list(enforced_elements)].sum()
+    lp = lambda capacity: where(capacity <= 0,0.0,where(capacity > cum_weights[-1] + 1e-9,inf,interp(capacity,cum_weights,cum_costs)))
+    before,item_weights,item_costs = cum_weights[:-1],heaviest[order],costs[order] # Weight of the items that the LP takes before each item
+    without = where(rest <= before,lp(rest),lp(rest + item_weights) - item_costs)
+    with_item = where(rest - item_weights <= before,lp(rest - item_weights) + item_costs,lp(rest))
+    return order,without + offset,with_item + offset
+
+def fixed_items(weights,costs,b,bounds,max_deviation=0.05) -> tuple[list,list]:
+    """ Knapsack reduction for the CE subproblem. Returns the free items that every CE solution contains and those that no CE solution contains,
+    given the item_bounds of the instance. A CE solution is an optimal cover, so its cost is at most that of any cover under the smallest weights 
+    and the largest capacity, here a greedy cover. Items whose bound without them, or with them, exceeds this cost are fixed."""
+    if bounds == None: return [],[]
+    dummy,upper = greedy_cover(asarray(weights,dtype=float)*(1-max_deviation),costs,b*(1+max_deviation))
+    items,without,with_item = bounds
+    return sorted(int(item) for item in items[without > upper + 1e-6]),sorted(int(item) for item in items[with_item > upper + 1e-6])
+
+def bounds_for_c(weights,costs,b,enforced_elements=[],disallowed_elements=[],constrained_set=[],max_deviation=0.05,fixed_in=[],fixed_out=[]) -> tuple[int,int]:
+    """ c_min and c_max like find_bounds_for_c, but from LP relaxations and greedy covers first. A MIP only runs if they do not meet,
+    c_min respects the items fixed by fixed_items, and c_max is at most the cost of a greedy cover without the favoured solution space,
+    since a CE solution is an optimal cover. Returns an empty range if no favoured cover exists. Costs have to be non-negative, otherwise find_bounds_for_c is used."""
+    weights,costs = asarray(weights,dtype=float),asarray(costs,dtype=float)
+    if len(costs) == 0 or min(costs) < 0: return find_bounds_for_c(weights,costs,b,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set,max_deviation=max_deviation)
+    integral = is_integral(list(costs))
+    lower_bound = lambda value: int(ceil(value-1e-6)) if integral else value
+
+    # c_min, the cheapest favoured cover under the largest weights
+    heaviest,enforced,disallowed = weights*(1+max_deviation),sorted(set(enforced_elements)|set(fixed_in)),sorted(set(disallowed_elements)|set(fixed_out))
+    relaxed = relaxed_cover(heaviest,costs,b*(1-max_deviation),enforced,disallowed)
+    if relaxed == GRB.INFINITY or set(enforced) & set(disallowed): return 0,-1
+    dummy,c_min = greedy_cover(heaviest,costs,b*(1-max_deviation),enforced,disallowed,constrained_set)
+    if lower_bound(relaxed) < c_min:
+        solution,c_min,dummy = bip_solve_cover(heaviest,costs,b*(1-max_deviation),enforced_elements=enforced,disallowed_elements=disallowed,constrained_set=constrained_set)
+        if solution == False: return 0,-1
+
+    # c_max, the cheapest favoured cover under the smallest weights, but at most the cheapest cover
+    lightest = weights*(1-max_deviation)
+    if sum(lightest) < b*(1+max_deviation): return int(c_min),int(sum(costs))
+    dummy,upper = greedy_cover(lightest,costs,b*(1+max_deviation))
+    relaxed = relaxed_cover(lightest,costs,b*(1+max_deviation),enforced_elements,disallowed_elements)
+    dummy,c_max = greedy_cover(lightest,costs,b*(1+max_deviation),enforced_elements,disallowed_elements,constrained_set)
+    if lower_bound(relaxed) < min(c_max,upper):
+        solution,c_max,dummy = bip_solve_cover(lightest,costs,b*(1+max_deviation),enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set)
+        if solution == False: c_max = GRB.INFINITY
+    return int(c_min),int(floor(min(c_max,upper)+1e-6))
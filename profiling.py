@@ -0,0 +1,79 @@
+from time import time
+from contextlib import contextmanager
+import json as j
+
+enabled = True # False turns record() into a no-op
+profile_counts = {} # Model or phase name -> counts and times, see new_counts
+trace_file = None # Open JSONL file that receives one line per recorded event, see start_trace
+trace_records = True # False leaves builds and solves out of the trace, so it only contains the progress of runs
+verbose = True # False stops events from printing their messages, the trace still receives them
+phases = set() # Names of timed blocks that time a phase of a run instead of one solver call, their times include those of the solver calls within
+
+def new_counts() -> dict:
+    """Counts of one model or phase. builds are model constructions and the updates of kept models between solves, solve_time the wall time of solves, gurobi_time
+    the part of it that Gurobi reports as its runtime, nodes the branch and bound nodes."""
+    return {'builds':0,'build_time':0.0,'solves':0,'solve_time':0.0,'gurobi_time':0.0,'nodes':0}
+
+def record(name:str,kind:str,seconds:float,gurobi_time:float=0.0,nodes:int=0):
+    """Adds one build (kind 'build') or solve (kind 'solve') of a model or phase to the counts and the trace."""
+    if not enabled: return
+    counts = profile_counts.setdefault(name,new_counts())
+    counts[kind+'s'] += 1
+    counts[kind+'_time'] += seconds
+    if kind == 'solve':
+        counts['gurobi_time'] += gurobi_time
+        counts['nodes'] += nodes
+    if trace_records: trace(kind,name=name,seconds=seconds,gurobi_time=gurobi_time,nodes=nodes)
+
+@contextmanager
+def timed(name:str,kind:str='solve',phase:bool=False):
+    """Records the time spent in a with block, e.g. for DP oracles or, with phase=True, the phases of run_cf."""
+    if phase: phases.add(name)
+    start = time()
+    try: yield
+    finally: record(name,kind,time()-start)
+
+def built(m,start:float):
+    """Records the construction of a Gurobi model that started at start, including the final update."""
+    m.update()
+    record(m.ModelName,'build',time()-start)
+
+def optimize(m,callback=None):
+    """Optimizes a Gurobi model, optionally with a callback, and records wall time, Gurobi runtime and node count under the model name."""
+    start = time()
+    m.optimize(callback)
+    record(m.ModelName,'solve',time()-start,gurobi_time=m.Runtime,nodes=int(m.NodeCount) if m.IsMIP else 0)
+
+def profile_info(since=None) -> dict:
+    """Counts per model and phase, counted from a previous profile_info() if since is given."""
+    since = since if since != None else {}
+    return {name:{count:counts[count]-since.get(name,new_counts())[count] for count in counts} for name,counts in profile_counts.items() if counts != since.get(name)}
+
+def merge_profiles(profile:dict,other:dict) -> dict:
+    """Adds the counts of other to profile, e.g. for counts from worker processes."""
+    for name,counts in other.items():
+        profile[name] = {count:profile.get(name,new_counts())[count]+counts[count] for count in counts}
+    return profile
+
+def start_trace(filename:str,records:bool=True,append:bool=True):
+    """Writes every following event to a JSONL file, which can be followed live, e.g. with tail -f. By default, the file is appended to, so a resumed run
+    continues the trace of its previous attempts, append=False starts a new file. records=False only traces the progress of runs and leaves out all builds and solves."""
+    global trace_file,trace_records
+    stop_trace()
+    trace_file,trace_records = open(filename,'a' if append else 'w'),records
+
+def stop_trace():
+    global trace_file
+    if trace_file != None: trace_file.close()
+    trace_file = None
+
+def trace(event:str,**fields):
+    """Writes one event to the trace, if a trace was started."""
+    if trace_file == None: return
+    trace_file.write(j.dumps({'time':time(),'event':event,**fields})+'\n')
+    trace_file.flush()
+
+def event(name:str,*message,**fields):
+    """Progress event of a run, e.g. a new incumbent. The message is given like the arguments of print and printed, the trace receives it with the fields."""
+    if verbose and message != (): print(*message)
+    trace(name,**fields,**({'message':" ".join(str(part) for part in message)} if message != () else {}))
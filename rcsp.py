@@ -0,0 +1,357 @@
+from IO import spprclib_store_reader,write_as_json
+from solver import linear_expression,add_deviation_constraints
+from dp import dp_solve_rcsp
+from profiling import timed,built,optimize,profile_info,start_trace,stop_trace,trace
+from numpy import asarray,floor,cumsum,triu_indices,isin,flatnonzero
+from sys import argv
+from os import listdir
+from os.path import join,exists,basename,splitext
+from multiprocessing import get_context
+from time import time
+from gurobipy import GRB
+import gurobipy as gp
+
+# Resource constrained shortest paths (RCSP) on SPPRCLIB instances from data/sppcc. A path leads from the first to the last node and visits nodes
+# in ascending order. Its cost is the sum of the distances of its arcs plus the weights of its nodes, its demand the sum of the demands of its nodes,
+# which must not exceed the capacity. CEs change demands, the favoured solution space is given by enforced and removed nodes.
+
+printout = False
+oracle_backend = "dp" # "dp" solves RCSPs with the label-setting DP in dp.py, "gurobi" with bip_solve_rcsp
+
+def favoured_arcs(n:int,enforced_nodes=[],removed_nodes=[]):
+    """Arcs (i,j) with i < j that a path in the favoured solution space can use, i.e. that neither touch a removed node nor skip an enforced one.
+    Returns the tails and the heads as arrays."""
+    tails,heads = triu_indices(n,1)
+    enforced_before = cumsum(isin(range(n),enforced_nodes)) # Number of enforced nodes up to each node
+    keep = ~isin(tails,removed_nodes) & ~isin(heads,removed_nodes) & (enforced_before[heads-1] == enforced_before[tails])
+    return tails[keep],heads[keep]
+
+def add_path_constraints(m,xs,tails,heads,n:int) -> list:
+    """Adds flow conservation for arc variables xs, so that they form a path from node 0 to node n-1. Returns the inflow expression of every node."""
+    inflow,outflow = [gp.LinExpr() for node in range(n)],[gp.LinExpr() for node in range(n)]
+    for x,tail,head in zip(xs,tails.tolist(),heads.tolist()):
+        inflow[head].add(x)
+        outflow[tail].add(x)
+    m.addConstr(outflow[0] == 1)
+    m.addConstrs(inflow[node] == outflow[node] for node in range(1,n-1))
+    return inflow
+
+def bip_solve_rcsp(distances,node_weights,demands,capacity,enforced_nodes=[],removed_nodes=[]):
+    """Simple BIP for the RCSP, promoted from csp_pricing_mip in csp.ipynb. Arcs that leave the favoured solution space are left out of the model.
+    Returns the path as list of nodes, its cost and the runtime, or False,False,False if there is no feasible path."""
+    build_start = time()
+    distances,node_weights,demands = asarray(distances,dtype=float),asarray(node_weights,dtype=float),asarray(demands,dtype=float)
+    n = len(demands)
+    if 0 in removed_nodes or n-1 in removed_nodes: return False,False,False
+    tails,heads = favoured_arcs(n,enforced_nodes,removed_nodes)
+    m = gp.Model("RCSP")
+    m.Params.OutputFlag = 0
+    x = m.addMVar(len(tails),vtype=GRB.BINARY,obj=distances[tails,heads]+node_weights[heads]) # Each arc pays the weight of its head
+    xs = x.tolist()
+    m.ObjCon = node_weights[0]
+    add_path_constraints(m,xs,tails,heads,n)
+    m.addConstr(linear_expression(demands[heads],xs) <= capacity - demands[0]) # Capacity constraint
+    built(m,build_start)
+    optimize(m)
+    if m.status == GRB.OPTIMAL:
+        return [0]+sorted(heads[flatnonzero(x.X > 0.999)].tolist()), int(round(m.getObjective().getValue())), m.Runtime
+    else:
+        return False,False,False
+
+def solve_rcsp(distances,node_weights,demands,capacity,enforced_nodes=[],removed_nodes=[]):
+    """Solves an RCSP with the oracle chosen by oracle_backend."""
+    if oracle_backend == "dp":
+        with timed("RCSP DP"): return dp_solve_rcsp(distances,node_weights,demands,capacity,enforced_nodes=enforced_nodes,removed_nodes=removed_nodes)
+    return bip_solve_rcsp(distances,node_weights,demands,capacity,enforced_nodes=enforced_nodes,removed_nodes=removed_nodes)
+
+def inverted_domains(enforced_nodes=[],removed_nodes=[]) -> list:
+    """Solution spaces whose union is the complement of the favoured solution space, as (enforced nodes, removed nodes)."""
+    return [([],[node]) for node in enforced_nodes]+[([node],[]) for node in removed_nodes]
+
+def is_ce(distances,node_weights,demands,capacity,strong:bool,enforced_nodes=[],removed_nodes=[]) -> tuple[bool,list]:
+    """ Validates whether demands give a CE. For a weak CE no path may be cheaper than the cheapest path in the favoured solution space, for a strong CE
+    every path outside of it also has to be more expensive. Returns True and the cheapest favoured path, otherwise False and a counterexample path.
+    The counterexample is [] if no path in the favoured solution space is feasible."""
+    with timed("is_ce",phase=True):
+        path,favoured_domain_objective,dummy = solve_rcsp(distances,node_weights,demands,capacity,enforced_nodes=enforced_nodes,removed_nodes=removed_nodes)
+        if path == False: return False, []
+        counterexample,nominal_objective,dummy = solve_rcsp(distances,node_weights,demands,capacity)
+        if nominal_objective < favoured_domain_objective: return False, counterexample
+        if strong:
+            for enforced,removed in inverted_domains(enforced_nodes,removed_nodes):
+                counterexample,other_domain_objective,dummy = solve_rcsp(distances,node_weights,demands,capacity,enforced_nodes=enforced,removed_nodes=removed)
+                if counterexample != False and other_domain_objective <= favoured_domain_objective: return False, counterexample
+        return True, path
+
+def demand_bounds(demands,max_deviation=0.1):
+    """Smallest and largest integer demands within the mutable parameter space."""
+    demands = asarray(demands,dtype=float)
+    return demands-floor(demands*max_deviation),demands+floor(demands*max_deviation)
+
+def find_rcsp_bounds(distances,node_weights,demands,capacity,enforced_nodes=[],removed_nodes=[],max_deviation=0.1):
+    """c_min is the cost of the cheapest favoured path if all demands are as small as possible, None if there is no such path.
+    c_max is the smaller of the cost of the cheapest path if all demands are as large as possible, which is at least the cost of the cheapest path
+    for any demands, and the cost of the most expensive favoured path that is feasible for the smallest demands."""
+    low,high = demand_bounds(demands,max_deviation)
+    path,c_min,dummy = solve_rcsp(distances,node_weights,low,capacity,enforced_nodes=enforced_nodes,removed_nodes=removed_nodes)
+    if path == False: return None,None
+    dummy,negative_c_max,dummy = solve_rcsp(-asarray(distances,dtype=float),-asarray(node_weights,dtype=float),low,capacity,enforced_nodes=enforced_nodes,removed_nodes=removed_nodes)
+    path,c_max,dummy = solve_rcsp(distances,node_weights,high,capacity)
+    return c_min, min(c_max,-negative_c_max) if path != False else -negative_c_max
+
+class RcspSubproblem:
+    """ CE subproblem for the RCSP, promoted from ce_subproblem in csp.ipynb. It finds the smallest change of demands for which a favoured path
+    with a fixed cost is feasible and all paths of the cuts are infeasible. Like CounterfactualSubproblem in solver.py, one model is kept for all
+    objective candidates of a run, only the right-hand sides of the optimality and the cutoff constraint change and new cuts are appended.
+    A cut is a path that was cheaper than the favoured path, or for strong CEs a path outside the favoured solution space that was not more expensive.
+    Its demand has to exceed the capacity, which is valid for all candidates above the cost of the path, so for all later ones of an ascending search.
+    max_deviation = maximum relative change to the demands, i.e. 0.1 -> 10%
+    """
+    def __init__(self,distances,node_weights,demands,capacity,strong:bool,enforced_nodes=[],removed_nodes=[],max_deviation=0.1):
+        self.distances,self.node_weights,self.demands,self.capacity,self.strong = distances,node_weights,demands,capacity,strong
+        self.enforced_nodes,self.removed_nodes = enforced_nodes,removed_nodes
+        build_start = time()
+        n = len(demands)
+        distances,node_weights = asarray(distances,dtype=float),asarray(node_weights,dtype=float)
+        tails,heads = favoured_arcs(n,enforced_nodes,removed_nodes)
+        low,high = demand_bounds(demands,max_deviation)
+        m = gp.Model("CE-RCSP-Subproblem")
+        m.Params.OutputFlag = 0
+
+        # Variables, as vectors for reading and writing values and as lists for building expressions
+        x = m.addMVar(len(tails),vtype=GRB.BINARY) # Arcs of the favoured path
+        visits = m.addMVar(n,vtype=GRB.BINARY)
+        new_demands = m.addMVar(n,vtype=GRB.INTEGER,lb=low,ub=high)
+        visit_demands = m.addMVar(n,vtype=GRB.CONTINUOUS) # New demand of a node if the path visits it
+        delta_d = m.addMVar(n,vtype=GRB.CONTINUOUS) # Variables encoding norms
+        xs,vs,nds,zs,ds = x.tolist(),visits.tolist(),new_demands.tolist(),visit_demands.tolist(),delta_d.tolist()
+
+        # Constraints
+        inflow = add_path_constraints(m,xs,tails,heads,n)
+        m.addConstrs(vs[node] == inflow[node] for node in range(1,n))
+        m.addConstr(vs[0] == 1)
+        self.offset = node_weights[0] # Cost of the source, which every path visits
+        self.optimality = m.addConstr(linear_expression(distances[tails,heads]+node_weights[heads],xs) == 0) # Optimality, the right-hand side is the objective candidate minus offset
+        for z,new_demand,visit,bound in zip(zs,nds,vs,high.tolist()): # Linearises new demand times visit, which is all the capacity constraint needs
+            m.addLConstr(gp.LinExpr([1.0,-1.0,-bound],[z,new_demand,visit]),GRB.GREATER_EQUAL,-bound)
+        m.addConstr(linear_expression([1]*n,zs) <= capacity) # Feasibility in new demands
+        add_deviation_constraints(m,ds,nds,demands) # Linking/Objective
+        self.cutoff = m.addConstr(linear_expression([1]*n,ds) <= GRB.INFINITY) # Cutting off solution space, the right-hand side is the incumbent objective
+        self.path_constraints = {} # Cuts in the model, keyed by their set of nodes
+
+        # Objective
+        m.setObjective(linear_expression([1]*n,ds),GRB.MINIMIZE)
+        built(m,build_start)
+        self.m,self.new_demands,self.nds = m,new_demands,nds
+        self.start = None # Demands of the last CE, used as MIP start for the next candidate
+        self.stats = {} # Cut rounds, branch and bound nodes and new cuts of the last solve
+
+    def add_cut(self,path):
+        """ Adds a cut, unless the model already contains it. Returns False for cuts that were already there."""
+        key = frozenset(path)
+        if key in self.path_constraints: return False
+        self.path_constraints[key] = self.m.addConstr(linear_expression([1]*len(path),[self.nds[node] for node in path]) >= self.capacity + 1) # The path has to be infeasible
+        return True
+
+    def solve(self,target_objective,cuts=[],best_known_objective=GRB.INFINITY,timerlimit=None):
+        """ Solves the CE subproblem for one fixed objective value. New cuts are appended to cuts, which is returned as well.
+        Returns the new demands, the favoured path, the objective and the runtime, or None,None,GRB.INFINITY and the runtime if there is no CE."""
+        m = self.m
+        build_start = time()
+        self.optimality.RHS = target_objective - self.offset
+        self.cutoff.RHS = best_known_objective
+        for cut in cuts: self.add_cut(cut) # Cuts added from previous iterations
+        if self.start != None:
+            m.update()
+            self.new_demands.Start = self.start
+        built(m,build_start)
+
+        self.stats = {'rounds':0,'nodes':0,'cuts':0}
+        while True:
+            m.Params.TimeLimit = max(timerlimit - time(),0) if timerlimit != None else GRB.INFINITY
+            optimize(m)
+            self.stats['rounds'],self.stats['nodes'] = self.stats['rounds']+1,self.stats['nodes']+int(m.NodeCount)
+            if m.Status != GRB.OPTIMAL or (timerlimit != None and time() > timerlimit):
+                return None,None,GRB.INFINITY,m.Runtime,cuts
+            incumbent_demands = self.new_demands.X.round().astype(int).tolist()
+            ce_found, path_or_counterexample = is_ce(self.distances,self.node_weights,incumbent_demands,self.capacity,self.strong,enforced_nodes=self.enforced_nodes,removed_nodes=self.removed_nodes)
+            if ce_found:
+                self.start = incumbent_demands
+                return list(incumbent_demands),path_or_counterexample,int(round(m.getObjective().getValue())),m.Runtime,cuts
+            if not self.add_cut(path_or_counterexample): # The favoured path of the model is feasible, so this cannot happen
+                if printout: print("ERROR: Counterexample already in cuts",path_or_counterexample)
+                return None,None,GRB.INFINITY,m.Runtime,cuts
+            cuts.append(path_or_counterexample)
+            self.stats['cuts'] += 1
+            if printout: print("No CE found, adding cut",len(cuts),path_or_counterexample)
+
+class RcspLowerBound:
+    """ CE lower bound for the 1-norm from the cuts alone, which keeps one model for a whole run like CounterfactualLowerBound in solver.py.
+    max_deviation = maximum relative change to the demands, i.e. 0.1 -> 10%
+    """
+    def __init__(self,demands,capacity,max_deviation=0.1):
+        build_start = time()
+        self.capacity = capacity
+        low,high = demand_bounds(demands,max_deviation)
+        m = gp.Model("CE-RCSP-LowerBound")
+        m.Params.OutputFlag = 0
+        new_demands = m.addMVar(len(demands),vtype=GRB.INTEGER,lb=low,ub=high)
+        delta_d = m.addMVar(len(demands),vtype=GRB.CONTINUOUS,lb=0) # Variables encoding norms
+        ds = delta_d.tolist()
+        add_deviation_constraints(m,ds,new_demands.tolist(),demands) # Linking/Objective
+        m.setObjective(linear_expression([1]*len(demands),ds),GRB.MINIMIZE)
+        built(m,build_start)
+        self.m,self.new_demands,self.nds = m,new_demands,new_demands.tolist()
+        self.path_constraints = set() # Cuts in the model, by their set of nodes
+        self.lb = 0 # Without cuts, the original demands are optimal
+
+    def solve(self,cuts=[]):
+        """ Adds all new cuts and returns the lower bound and the solver runtime, which is 0 if no new cut arrived."""
+        new_cuts = [cut for cut in cuts if frozenset(cut) not in self.path_constraints]
+        if new_cuts == [] or self.lb == GRB.INFINITY: return self.lb, 0 # More cuts cannot make an infeasible model feasible
+        build_start = time()
+        for cut in new_cuts:
+            self.path_constraints.add(frozenset(cut))
+            self.m.addConstr(linear_expression([1]*len(cut),[self.nds[node] for node in cut]) >= self.capacity + 1)
+        built(self.m,build_start)
+        optimize(self.m)
+        self.lb = self.m.getObjective().getValue() if self.m.status == GRB.OPTIMAL else GRB.INFINITY
+        return self.lb, self.m.Runtime
+
+def run_rcsp(distances,node_weights,demands,capacity,strong:bool,enforced_nodes=[],removed_nodes=[],max_deviation=0.1,epsilon=0.001,timelimit=10*3600,trace_file=None):
+    """ Determines a counterfactual explanation for mutable demands with the candidate search of run_cf in main.py: objective candidates are visited
+    in ascending order, cuts are shared between candidates and a lower bound from the cuts ends the search once it reaches the incumbent.
+    The log has the same format as that of run_cf, with demands instead of weights and the favoured path of the CE."""
+    if trace_file != None: start_trace(trace_file)
+    log = {}
+    starttime = time()
+    profile_start = profile_info()
+
+    with timed("find_rcsp_bounds",phase=True): c_min,c_max = find_rcsp_bounds(distances,node_weights,demands,capacity,enforced_nodes=enforced_nodes,removed_nodes=removed_nodes,max_deviation=max_deviation)
+    print("Beginning optimisation:\nPotential objective range for CE: c_min:",c_min,"c_max:",c_max,"\n")
+    log['c_min'] = c_min
+    log['c_max'] = c_max
+    log['n_subproblems'] = c_max-c_min if c_min != None else 0
+
+    lb,lb_time = 0,0
+    cuts = [] # List of paths, [[nodes of the path],[...]]
+    iterationcounter = 0
+    incumbents,lbs = {},{}
+    time_per_iteration,rounds_per_iteration,nodes_per_iteration = {},{},{}
+    incumbent_demands,incumbent_path,incumbent_objective = None,None,GRB.INFINITY
+
+    ce_found, path = is_ce(distances,node_weights,demands,capacity,strong,enforced_nodes=enforced_nodes,removed_nodes=removed_nodes)
+    if ce_found:
+        print("Solution was already CE with favoured path",path)
+        log['solution'] = "Solution was already CE with cost 0."
+        incumbent_demands,incumbent_path,incumbent_objective = list(demands),path,0
+    elif c_min != None:
+        subproblem = RcspSubproblem(distances,node_weights,demands,capacity,strong,enforced_nodes=enforced_nodes,removed_nodes=removed_nodes,max_deviation=max_deviation)
+        lower_bound = RcspLowerBound(demands,capacity,max_deviation=max_deviation)
+
+        # This is the main iteration
+        for current_obj_candidate in range(c_min,c_max+1):
+            if time() - starttime > timelimit:
+                print(int((current_obj_candidate-c_min)/max(c_max-c_min,1)*100),r"% of values searched before timelimit.")
+                log['timelimit'] = True
+                break
+
+            iterationcounter += 1
+            start = time()
+            print(current_obj_candidate,current_obj_candidate-c_min,"out of",c_max-c_min,"Incumbent:",incumbent_objective,"LB:",lb)
+            new_demands,new_path,new_objective,runtime,cuts = subproblem.solve(current_obj_candidate,cuts,best_known_objective=incumbent_objective,timerlimit=starttime+timelimit)
+
+            # Solve LB problem based on CE cuts
+            lb_start = time()
+            lb_new,lb_runtime = lower_bound.solve(cuts)
+            lb_time += time() - lb_start
+
+            # Track optimality status
+            if lb_new > lb:
+                lb = lb_new
+                lbs[current_obj_candidate] = lb
+            if new_objective < incumbent_objective:
+                print("    Found new incumbent at ",current_obj_candidate," with objective",new_objective,", LB",lb,"\n")
+                incumbent_demands,incumbent_path,incumbent_objective = new_demands,new_path,new_objective
+                incumbents[current_obj_candidate] = new_objective
+
+            # Track time
+            time_per_iteration[current_obj_candidate] = time() - start
+            rounds_per_iteration[current_obj_candidate],nodes_per_iteration[current_obj_candidate] = subproblem.stats['rounds'],subproblem.stats['nodes']
+            trace('candidate',candidate=current_obj_candidate,seconds=time_per_iteration[current_obj_candidate],incumbent=incumbent_objective,lb=lb,total_cuts=len(cuts),**subproblem.stats)
+
+            # Check termination criteria
+            if incumbent_objective <= lb + epsilon:
+                print("Found final CE solution with objective",incumbent_objective,"current LB is",lb)
+                break
+
+    # Log all potentially important information
+    if incumbent_objective != GRB.INFINITY and 'timelimit' not in log: log['solved'] = True
+    elif 'timelimit' in log: log['solved'] = False
+    else: log['solved'] = "infeasible"
+    log['Final_UB'] = incumbent_objective
+    log['Final_LB'] = lb
+    log['total_iterations'] = iterationcounter
+    if incumbent_demands != None:
+        log['final_solution_demands'] = list(incumbent_demands)
+        log['final_solution_delta'] = [incumbent_demands[node]-demands[node] for node in range(len(demands))] # This is the deviation from the original demands
+        log['final_solution_path'] = incumbent_path
+        log['incumbents'] = incumbents
+    log['lbs'] = lbs
+    log['cuts'] = cuts
+    log['total_time_for_LBs'] = lb_time
+    log['time_per_iteration_in_s'] = time_per_iteration
+    log['rounds_per_iteration'] = rounds_per_iteration
+    log['nodes_per_iteration'] = nodes_per_iteration
+    log['profile'] = profile_info(since=profile_start)
+    if trace_file != None: stop_trace()
+    return log
+
+def rcsp_result_name(filename:str,mutable_parameter_space_size,ce_type) -> str:
+    """ Name of the results file of an RCSP experiment, without the .json ending."""
+    return 'rcsp_'+splitext(basename(filename))[0]+'_'+str(mutable_parameter_space_size)+'_'+str(ce_type)
+
+def run_rcsp_experiment(filename:str,mutable_parameter_space_size,ce_type,epsilon=0.01,timelimit=10*3600,trace_file=None):
+    """ Runs a CE experiment on an SPPRCLIB instance as in csp.ipynb: the favoured solution space removes the first node after the source
+    from the nominal shortest path. Returns the tracked data and the name of the results file."""
+    strong = ce_type == 'strong'
+    tracked_data = {"problem":"rcsp","input":{'instance':basename(filename),'mutable_parameter_space_size':str(mutable_parameter_space_size)},"Is strong?":strong,"parameters":{"epsilon":epsilon,'strong':strong,'oracle_backend':oracle_backend}}
+    capacity,demands,distances,node_weights = spprclib_store_reader(filename)
+
+    timer = time()
+    path,objective,runtime = solve_rcsp(distances,node_weights,demands,capacity)
+    print("\nSolved nominal problem\nNominal shortest path has cost",objective,"and nodes",path)
+    tracked_data['nominal'] = {'path':path,'objective':objective,'runtime':runtime}
+    if len(path) <= 2:
+        print("Trivial shortest path only contains source and sink. No CE possible.")
+        tracked_data['result'] = {'solved':"trivial",'solution':"Trivial shortest path only contains source and sink. No CE possible."}
+    else:
+        tracked_data['removed_nodes'] = [path[1]]
+        tracked_data['result'] = run_rcsp(distances,node_weights,demands,capacity,strong,removed_nodes=[path[1]],max_deviation=float(mutable_parameter_space_size),epsilon=epsilon,timelimit=timelimit,trace_file=trace_file)
+    tracked_data['total_runtime_in_s'] = time()-timer
+    tracked_data['instance'] = {'demands':list(demands),'node_weights':list(node_weights),'capacity':capacity}
+    return tracked_data, rcsp_result_name(filename,mutable_parameter_space_size,ce_type)
+
+def run_rcsp_job(job) -> tuple:
+    """ Runs one experiment of the batch and writes its results file."""
+    filename,mutable_parameter_space_size,ce_type = job
+    tracked_data, name = run_rcsp_experiment(filename,mutable_parameter_space_size,ce_type)
+    write_as_json(tracked_data,name)
+    return name,tracked_data['total_runtime_in_s']
+
+if __name__ == "__main__":
+    # Example execution: python3 rcsp.py 0.1 X 8
+    # Meaning: python3 rcsp.py [size of mutable parameter space] [CE type] [number of processes] [instance files]
+    # [size of mutable parameter space]: between 0 and 1, e.g. 0.1 for 10%
+    # [CE type]: 'strong' or any other string for weak CEs
+    # [instance files]: optional paths of .sppcc files, all instances in data/sppcc by default
+    # Instances whose results file exists are skipped.
+    filenames = argv[4:] if len(argv) > 4 else [join('data','sppcc',filename) for filename in sorted(listdir(join('data','sppcc'))) if filename.lower().endswith('.sppcc')]
+    jobs = [(filename,argv[1],argv[2]) for filename in filenames if not exists(join('results',rcsp_result_name(filename,argv[1],argv[2])+".json"))]
+    processes = int(argv[3]) if len(argv) > 3 else 1
+    print("Running",len(jobs),"RCSP jobs with",processes,"processes.")
+    starttime,counter = time(),0
+    with get_context("spawn").Pool(processes) as pool:
+        for name,runtime in pool.imap_unordered(run_rcsp_job,jobs):
+            counter += 1
+            print("Finished",counter,"out of",len(jobs),":",name,"in",round(runtime,2),"s, total",round(time()-starttime,2),"s")
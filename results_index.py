@@ -0,0 +1,148 @@
+from os import listdir,makedirs,remove,stat
+from os.path import join,exists
+from statistics import mean
+from numpy import array,cumsum,savez_compressed,load
+from sys import argv
+import json as j
+
+# Scalar columns of the index and where to find them in a results file. Bulky fields are kept in side storage, see side_arrays.
+columns = {
+    'instance_type':('input','instance_type'),
+    'instance_size':('input','instance_size'),
+    'favoured_solution_space_types':('input','favoured_solution_space_types'),
+    'mutable_parameter_space_size':('input','mutable_parameter_space_size'),
+    'instance_index':('input','instance_index'),
+    'strong':('Is strong?',),
+    'epsilon':('parameters','epsilon'),
+    'solved':('result','solved'),
+    'timelimit':('result','timelimit'),
+    'Final_UB':('result','Final_UB'),
+    'Final_LB':('result','Final_LB'),
+    'c_min':('result','c_min'),
+    'c_max':('result','c_max'),
+    'n_subproblems':('result','n_subproblems'),
+    'total_iterations':('result','total_iterations'),
+    'original_runtime':('result','original_runtime'),
+    'total_time_for_LBs':('result','total_time_for_LBs'),
+    'total_runtime_in_s':('total_runtime_in_s',),
+    'final_solution_capacity':('result','final_solution_capacity'),
+}
+conversions = {'instance_size':int,'mutable_parameter_space_size':float} # The command line stores these as strings
+
+def lookup(data:dict,path:tuple):
+    """Value at path in a results file, None if it is missing."""
+    for key in path:
+        if not isinstance(data,dict) or key not in data: return None
+        data = data[key]
+    return data
+
+def side_arrays(data:dict) -> dict:
+    """Bulky fields of a results file as flat arrays. Cuts are stored as all their items plus the offset where each cut ends."""
+    result = data['result']
+    cuts = result.get('cuts',[])
+    arrays = {
+        'weights':array(data['instance']['weights'],dtype=float),
+        'costs':array(data['instance']['costs'],dtype=float),
+        'final_solution_weights':array(result.get('final_solution_weights',[]),dtype=float),
+        'cut_items':array([item for cut in cuts for item in cut],dtype=int),
+        'cut_ends':cumsum([len(cut) for cut in cuts],dtype=int),
+    }
+    for field in ['time_per_iteration_in_s','lbs','incumbents']: # Dicts from objective candidates to values
+        arrays[field+'_candidates'] = array([int(candidate) for candidate in result.get(field,{})],dtype=int)
+        arrays[field+'_values'] = array(list(result.get(field,{}).values()),dtype=float)
+    return arrays
+
+class ResultsIndex:
+    """Columnar index over the results directory. Scalar fields of every results file are stored in one table, bulky fields in one
+    compressed side file per run that is only read when asked for. update() only parses files that are new or changed since the last update."""
+    def __init__(self,results_dir:str='results'):
+        self.results_dir = results_dir
+        self.index_dir = join(results_dir,'.index')
+        self.files = {} # Results file -> [modification time, size], for files that are not runs this is marked in the last entry
+        self.table = {column:[] for column in ['name']+list(columns)}
+        if exists(join(self.index_dir,'table.json')):
+            with open(join(self.index_dir,'table.json')) as file:
+                stored = j.load(file)
+            if set(stored['columns']) == set(self.table): self.files,self.table = stored['files'],stored['columns']
+
+    def __len__(self) -> int:
+        return len(self.table['name'])
+
+    def update(self) -> int:
+        """Indexes all new or changed results files and drops removed ones. Returns the number of parsed files."""
+        makedirs(join(self.index_dir,'side'),exist_ok=True)
+        current = {filename:[stat(join(self.results_dir,filename)).st_mtime,stat(join(self.results_dir,filename)).st_size] for filename in listdir(self.results_dir) if filename.endswith('.json')}
+        changed = [filename for filename in sorted(current) if self.files.get(filename,[None,None])[:2] != current[filename]]
+        removed = [filename for filename in self.files if filename not in current]
+        self.drop(removed+[filename for filename in changed if filename in self.files])
+        for filename in changed: # One file at a time, so only one results file is in memory
+            with open(join(self.results_dir,filename)) as file:
+                data = j.load(file)
+            if not isinstance(data,dict) or 'result' not in data or data.get('problem') == 'rcsp': # RCSP results have a different format
+                self.files[filename] = current[filename]+[False]
+                continue
+            name = filename[:-len('.json')]
+            self.table['name'].append(name)
+            for column,path in columns.items():
+                value = lookup(data,path)
+                self.table[column].append(conversions[column](value) if column in conversions and value != None else value)
+            savez_compressed(join(self.index_dir,'side',name+'.npz'),**side_arrays(data))
+            self.files[filename] = current[filename]+[True]
+        if changed != [] or removed != []: self.save()
+        return len(changed)
+
+    def drop(self,filenames:list):
+        """Removes results files from the index."""
+        names = set(filename[:-len('.json')] for filename in filenames if self.files.get(filename,[None,None,False])[2])
+        keep = [row for row,name in enumerate(self.table['name']) if name not in names]
+        self.table = {column:[values[row] for row in keep] for column,values in self.table.items()}
+        for name in names:
+            if exists(join(self.index_dir,'side',name+'.npz')): remove(join(self.index_dir,'side',name+'.npz'))
+        for filename in filenames: self.files.pop(filename,None)
+
+    def save(self):
+        with open(join(self.index_dir,'table.json'),'w') as file:
+            j.dump({'files':self.files,'columns':self.table},file)
+
+    def select(self,where={},columns:list=None) -> list:
+        """Rows as dicts, restricted to the given columns. where maps columns to a value, a list of values or a function that accepts a value."""
+        rows = range(len(self))
+        for column,condition in where.items():
+            values = self.table[column]
+            if callable(condition): rows = [row for row in rows if condition(values[row])]
+            elif isinstance(condition,list): rows = [row for row in rows if values[row] in condition]
+            else: rows = [row for row in rows if values[row] == condition]
+        return [{column:self.table[column][row] for column in (columns if columns != None else self.table)} for row in rows]
+
+    def group(self,by:list,column:str,aggregate=mean,where={}) -> dict:
+        """Aggregates a column per group, e.g. group(['instance_size'],'total_runtime_in_s') for the mean runtime per size.
+        Missing values are ignored, aggregate=len counts the runs per group."""
+        groups = {}
+        for row in self.select(where,by+[column]):
+            if row[column] != None: groups.setdefault(tuple(row[key] for key in by),[]).append(row[column])
+        return {key:aggregate(values) for key,values in sorted(groups.items(),key=lambda item:[(type(key).__name__,key) for key in item[0]])}
+
+    def side(self,name:str):
+        """Bulky fields of one run as a lazily loading npz file, see side_arrays for the field names."""
+        return load(join(self.index_dir,'side',name+'.npz'))
+
+    def cuts(self,name:str) -> list:
+        """Cuts of one run in the format of run_cf."""
+        side = self.side(name)
+        items,ends = side['cut_items'].tolist(),side['cut_ends'].tolist()
+        return [items[start:end] for start,end in zip([0]+ends[:-1],ends)]
+
+def load_index(results_dir:str='results') -> ResultsIndex:
+    """Opens the index of a results directory and indexes new results files."""
+    index = ResultsIndex(results_dir)
+    index.update()
+    return index
+
+if __name__ == "__main__":
+    # Example execution: python3 results_index.py instance_size total_runtime_in_s
+    # Updates the index and prints the mean of a column grouped by another column. Without arguments, counts runs per size and solution status.
+    index = load_index()
+    if len(argv) > 2:
+        for key,value in index.group([argv[1]],argv[2]).items(): print(*key,value)
+    else:
+        for key,value in index.group(['instance_size','solved'],'total_iterations',aggregate=len).items(): print(*key,value)
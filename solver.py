@@ -1,79 +1,160 @@
 from gurobipy import GRB
 import gurobipy as gp
 from time import time
+from collections import OrderedDict
+from hashlib import blake2b
+from numpy import asarray,argsort,cumsum,interp,floor,ceil,arange,isin,where,flatnonzero
+from dp import is_integral,dp_solve_cover,dp_solve_knapsack,dp_seperate_minimal_inequality,dp_max_weight_per_cost
+from profiling import timed,built,optimize
 
 printout = False
+oracle_backend = "auto" # "gurobi", "dp" or "auto": Knapsack, Cover and Separation are solved by DP if the weights are integral and the DP table is small enough
+dp_max_work = 10**7 # Largest number of items times DP states for which "auto" chooses the DP
+
+def use_dp(weights,b,states:int) -> bool:
+    """Decides whether an oracle is solved by DP or by Gurobi."""
+    if oracle_backend == "gurobi" or not is_integral(list(weights)+[b]): return False
+    return oracle_backend == "dp" or len(weights)*states <= dp_max_work
+
+cache_size = 4096 # Entries per oracle cache, 0 disables caching
+oracle_caches = {'is_cf':OrderedDict(),'Cover':OrderedDict(),'Separation':OrderedDict()} # LRU caches for the results of is_cf and the oracles it calls
+cache_counts = {name:{'hits':0,'misses':0} for name in oracle_caches}
+
+def fingerprint(values) -> bytes:
+    """Hash of a vector of weights or costs, used in cache keys instead of the vector itself."""
+    return blake2b(asarray(values,dtype=float).tobytes(),digest_size=16).digest()
+
+def domain_key(enforced_elements=[],disallowed_elements=[],constrained_set=[],cover_set=[]) -> tuple:
+    """Hashable description of a solution space."""
+    return (tuple(enforced_elements),tuple(disallowed_elements),tuple((tuple(item['variables']),item['rhs']) for item in constrained_set),tuple((tuple(item['variables']),item['rhs']) for item in cover_set))
+
+def cached(name:str,key,solve):
+    """Returns the cached result for key, otherwise stores and returns solve(). Results are shared, so callers must not modify them."""
+    cache = oracle_caches[name]
+    if key in cache:
+        cache.move_to_end(key)
+        cache_counts[name]['hits'] += 1
+        return cache[key]
+    cache_counts[name]['misses'] += 1
+    result = solve()
+    if cache_size > 0:
+        cache[key] = result
+        if len(cache) > cache_size: cache.popitem(last=False) # Drop the least recently used result
+    return result
+
+def cache_info(since=None) -> dict:
+    """Hits and misses per cache, counted from a previous cache_info() if since is given."""
+    return {name:{count:cache_counts[name][count]-(since[name][count] if since != None else 0) for count in counts} for name,counts in cache_counts.items()}
+
+def clear_caches():
+    """Empties all oracle caches, the counters are kept."""
+    for cache in oracle_caches.values(): cache.clear()
+
+def side_constraint_states(constrained_set=[],cover_set=[],deviate_from_solution=[]) -> int:
+    """Upper bound on the factor by which side constraints multiply the states of a DP."""
+    states = 2 if deviate_from_solution != [] else 1
+    for item in constrained_set+cover_set: states *= len(item['variables'])+1
+    return states
+
+def linear_expression(coefficients,variables) -> gp.LinExpr:
+    """Linear expression from a vector of coefficients and a list of variables, built in one call instead of term by term."""
+    return gp.LinExpr(asarray(coefficients,dtype=float).tolist(),variables)
+
+def add_side_constraints(m,xs,enforced_elements=[],disallowed_elements=[],constrained_set=[],cover_set=[],deviate_from_solution=[]):
+    """Adds the constraints of a favoured solution space and deviate_from_solution to a model with binary variables xs."""
+    m.addConstrs(xs[index] == 1 for index in enforced_elements) # These and the following two constraints model favoured solution spaces
+    m.addConstrs(xs[index] == 0 for index in disallowed_elements)
+    for item in constrained_set: m.addConstr(linear_expression([1]*len(item["variables"]),[xs[index] for index in item["variables"]]) <= item['rhs'])
+    for item in cover_set: m.addConstr(linear_expression([1]*len(item["variables"]),[xs[index] for index in item["variables"]]) >= item['rhs'])
+    if deviate_from_solution != []: # This ensures that not all variables have the same assignment as in a given solution, sum(1-x) over the solution plus sum(x) over all others
+        in_solution = isin(range(len(xs)),deviate_from_solution)
+        m.addConstr(linear_expression(where(in_solution,-1,1),xs) >= 1 - in_solution.sum())
+
+def add_deviation_constraints(m,ds,ws,weights):
+    """Adds delta >= new weight - weight and delta >= weight - new weight for every item, which linearises the 1-norm."""
+    weights = asarray(weights,dtype=float).tolist()
+    for delta,new_weight,weight in zip(ds,ws,weights): m.addLConstr(gp.LinExpr([1.0,-1.0],[delta,new_weight]),GRB.GREATER_EQUAL,-weight)
+    for delta,new_weight,weight in zip(ds,ws,weights): m.addLConstr(gp.LinExpr([1.0,1.0],[delta,new_weight]),GRB.GREATER_EQUAL,weight)
 
 def bip_solve_knapsack(weights,costs,b:int,enforced_elements=[],disallowed_elements=[],constrained_set=[],deviate_from_solution=[]):
     """Simple BIP for a Knapsack instance. Can solve Knapsack problems with variable fixations or constrained sets.
     deviate_from_solution enforces that at least one variable to differs from a given solution."""
-    indices = list(range(len(weights)))
+    if use_dp(weights,b,(b+1)*side_constraint_states(constrained_set,deviate_from_solution=deviate_from_solution)):
+        with timed("Knapsack Subproblem DP"): return dp_solve_knapsack(weights,costs,b,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set,deviate_from_solution=deviate_from_solution)
+    build_start = time()
     m = gp.Model("Knapsack Subproblem")
     m.ModelSense = GRB.MAXIMIZE
     m.Params.OutputFlag = 0
-    x = m.addVars(indices,vtype=GRB.BINARY,obj=costs)
-    m.addConstr(gp.quicksum(weights[index]*x[index] for index in indices) <= b)  # This is the actual Knapsack constraint
-    m.addConstrs(x[index] == 1 for index in enforced_elements) # These and the following two constraints model favoured solution spaces
-    m.addConstrs(x[index] == 0 for index in disallowed_elements)
-    for item in constrained_set: m.addConstr(gp.quicksum(x[index] for index in item["variables"]) <= item['rhs'])
-    if deviate_from_solution != []: # This ensures that not all variables have the same assignment as in a given solution
-        m.addConstr(gp.quicksum((1-x[index]) for index in deviate_from_solution) + gp.quicksum(x[index] for index in range(len(weights)) if index not in deviate_from_solution) >= 1)
-    m.update()
-    m.optimize()
+    x = m.addMVar(len(weights),vtype=GRB.BINARY,obj=asarray(costs,dtype=float))
+    xs = x.tolist()
+    m.addConstr(linear_expression(weights,xs) <= b)  # This is the actual Knapsack constraint
+    add_side_constraints(m,xs,enforced_elements,disallowed_elements,constrained_set,deviate_from_solution=deviate_from_solution)
+    built(m,build_start)
+    optimize(m)
     if m.status == GRB.OPTIMAL:
-        return [index for index in indices if x[index].x > 0.999], int(m.getObjective().getValue()), m.Runtime
+        return flatnonzero(x.X > 0.999).tolist(), int(m.getObjective().getValue()), m.Runtime
     else:
         return False
     
 def bip_solve_cover(weights,costs,b:int,enforced_elements=[],disallowed_elements=[],constrained_set=[],deviate_from_solution=[],cover_set=[]):
     """Simple BIP for a Cover instance. Exclusively used in the separation problem for general weak/strong CFs."""
-    indices = list(range(len(weights)))
+    if use_dp(weights,b,max(sum(weights)-b+1,1)*side_constraint_states(constrained_set,cover_set,deviate_from_solution)):
+        with timed("Cover DP"): return dp_solve_cover(weights,costs,b,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set,deviate_from_solution=deviate_from_solution,cover_set=cover_set)
+    build_start = time()
     m = gp.Model("Cover")
     m.ModelSense = GRB.MINIMIZE
     m.Params.OutputFlag = 0
-    x = m.addVars(indices,vtype=GRB.BINARY,obj=costs)
-    m.addConstr(gp.quicksum(weights[index]*x[index] for index in indices) >= b) # Cover constraint
-    m.addConstrs(x[index] == 1 for index in enforced_elements) # These and the following two constraints model favoured solution spaces
-    m.addConstrs(x[index] == 0 for index in disallowed_elements)
-    for item in constrained_set: m.addConstr(gp.quicksum(x[index] for index in item["variables"]) <= item['rhs'])
-    for item in cover_set: m.addConstr(gp.quicksum(x[index] for index in item["variables"]) >= item['rhs'])
-    if deviate_from_solution != []: # This ensures that not all variables have the same assignment as in a given solution
-        m.addConstr(gp.quicksum((1-x[index]) for index in deviate_from_solution) + gp.quicksum(x[index] for index in range(len(weights)) if index not in deviate_from_solution) >= 1)
-    m.update()
-    m.optimize()
+    x = m.addMVar(len(weights),vtype=GRB.BINARY,obj=asarray(costs,dtype=float))
+    xs = x.tolist()
+    m.addConstr(linear_expression(weights,xs) >= b) # Cover constraint
+    add_side_constraints(m,xs,enforced_elements,disallowed_elements,constrained_set,cover_set,deviate_from_solution)
+    built(m,build_start)
+    optimize(m)
     if m.status == GRB.OPTIMAL:
-        return [index for index in indices if x[index].x>0.999], int(m.getObjective().getValue()), m.Runtime
+        return flatnonzero(x.X > 0.999).tolist(), int(m.getObjective().getValue()), m.Runtime
     else:
         return False,False,False
 
 def seperate_minimal_inequality(weights:list,costs:list,b:int,favoured_domain_objective:int):
     """This finds a smallest violating subset for general weak/strong CEs. Returns true is a CE exists, otherwise returns false and a minimal counterexample."""
-    indices = list(range(len(weights)))
+    if min(costs) >= 0 and use_dp(weights,b,b+max(weights)):
+        with timed("Separation DP"): return dp_seperate_minimal_inequality(weights,costs,b,favoured_domain_objective)
+    build_start = time()
     m = gp.Model("Separation")
     m.ModelSense = GRB.MINIMIZE
     m.Params.OutputFlag = 0
-    x = m.addVars(indices,vtype=GRB.BINARY,obj=weights)
-    m.addConstr(gp.quicksum(weights[index]*x[index] for index in indices) >= b) # Cover constraint
-    m.addConstr(gp.quicksum(costs[index]*x[index] for index in indices) <= favoured_domain_objective-1) # Better solution
-    m.update()
-    m.optimize()
+    x = m.addMVar(len(weights),vtype=GRB.BINARY,obj=asarray(weights,dtype=float))
+    xs = x.tolist()
+    m.addConstr(linear_expression(weights,xs) >= b) # Cover constraint
+    m.addConstr(linear_expression(costs,xs) <= favoured_domain_objective-1) # Better solution
+    built(m,build_start)
+    optimize(m)
     if m.status == GRB.OPTIMAL:
-        return [index for index in indices if x[index].x>0.999], int(m.getObjective().getValue()), m.Runtime
+        return flatnonzero(x.X > 0.999).tolist(), int(m.getObjective().getValue()), m.Runtime
     else:
         return False,False,False
 
 def is_cf(weights,costs,b:int,strong:bool,enforced_elements=[],disallowed_elements=[],constrained_set=[],objective=False) -> tuple[bool,list]:
     """ Validates whether an instance is a CE by comparing the objective of the nominal problem with the objective of the problem constrained to the favoured solution space.
-        If a CE exists, return true and a solution, otherwise, returns and a minimal counterexample solution."""
-    
+        If a CE exists, return true and a solution, otherwise, returns and a minimal counterexample solution. 
+        Results are cached by weights, costs, b and the favoured solution space, see check_cf for the uncached version.
+        Its profile includes the time of the oracles it calls."""
+    key = (fingerprint(weights),fingerprint(costs),b,strong,domain_key(enforced_elements,disallowed_elements,constrained_set))
+    with timed("is_cf",phase=True): return cached('is_cf',key,lambda: check_cf(weights,costs,b,strong,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set))
+
+def check_cf(weights,costs,b:int,strong:bool,enforced_elements=[],disallowed_elements=[],constrained_set=[]) -> tuple[bool,list]:
+    """ Uncached version of is_cf. Its Cover and Separation solves are still cached, since they are shared between weak and strong CEs, 
+        and the Separation problem does not depend on the favoured solution space."""
+    weights_key = (fingerprint(weights),fingerprint(costs),b)
+
     # If the problem does not contain a feasible solution in the favoured solution space, we do no have a CF => return False
-    solution,favoured_domain_objective,dummy = bip_solve_cover(weights,costs,b,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set)
+    solution,favoured_domain_objective,dummy = cached('Cover',weights_key+(domain_key(enforced_elements,disallowed_elements,constrained_set),),lambda: bip_solve_cover(weights,costs,b,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set))
     if solution == False: 
         if printout: print("Problem infeasible, no CE")
         return False, []
     
     # Otherwise, solve the separation problem for the favoured solution space
-    counterexample,nominal_objective,dummy = seperate_minimal_inequality(weights,costs,b,favoured_domain_objective=favoured_domain_objective) 
+    counterexample,nominal_objective,dummy = cached('Separation',weights_key+(favoured_domain_objective,),lambda: seperate_minimal_inequality(weights,costs,b,favoured_domain_objective=favoured_domain_objective))
 
     if counterexample == False:
         if not strong:
@@ -91,7 +172,7 @@ def is_cf(weights,costs,b:int,strong:bool,enforced_elements=[],disallowed_elemen
                 local_constrained_set = []
                 local_cover_set = [{'variables':item['variables'],'rhs':item['rhs']+1} for item in constrained_set] 
             
-            alt_solution,other_domain_objective,dummy = bip_solve_cover(weights,costs,b,constrained_set=local_constrained_set,cover_set=local_cover_set)
+            alt_solution,other_domain_objective,dummy = cached('Cover',weights_key+(domain_key(constrained_set=local_constrained_set,cover_set=local_cover_set),),lambda: bip_solve_cover(weights,costs,b,constrained_set=local_constrained_set,cover_set=local_cover_set))
 
             if abs(other_domain_objective-favoured_domain_objective) < 0.001:
                 if printout: print("Weak but no strong CE, adding ineqality to seperate non-favoured solution.")
@@ -111,93 +192,319 @@ def find_bounds_for_c(weights,costs,b,enforced_elements=[],disallowed_elements=[
     dummy, c_min,dummy = bip_solve_cover(weights*(1+max_deviation),costs,b*(1-max_deviation),enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set)
     return int(c_min),int(c_max)
 
-def solve_counterfactual_subproblem(weights,costs,b,target_objective,strong:bool,cuts=[],best_known_objective=GRB.INFINITY,enforced_elements=[],disallowed_elements=[],constrained_set=[],max_deviation=0.05,timerlimit=None):
-    """ Solves a CE subproblem for one fixed objective values.
+def relaxed_max_weight_per_cost(weights,costs,max_cost:int,enforced_elements=[],disallowed_elements=[]):
+    """Upper bound on the total weight of a solution with cost c for every c from 0 to max_cost, from the LP relaxation of max weights*x s.t. costs*x <= c.
+    Constrained sets are relaxed, costs have to be non-negative."""
+    weights,costs = asarray(weights,dtype=float),asarray(costs,dtype=float)
+    free = ~isin(range(len(weights)),list(enforced_elements)+list(disallowed_elements))
+    offset,fixed_weight = costs[list(enforced_elements)].sum(),weights[list(enforced_elements)].sum()+weights[free & (costs == 0)].sum()
+    paid = free & (costs > 0)
+    order = argsort(-weights[paid]/costs[paid]) # The LP takes items by decreasing weight per cost
+    budgets = arange(max_cost+1)-offset
+    best = interp(budgets,cumsum([0]+list(costs[paid][order])),cumsum([0]+list(weights[paid][order]))) + fixed_weight
+    best[budgets < 0] = -float('inf')
+    return best
+
+def candidate_bounds(weights,costs,b,c_min:int,c_max:int,enforced_elements=[],disallowed_elements=[],constrained_set=[],max_deviation=0.05) -> dict:
+    """ Lower bound on the objective of the CE subproblem for every objective candidate, GRB.INFINITY for candidates without a feasible solution.
+    A solution x with cost c needs its weights to grow by at least b - weights*x, and it cannot cover b if even its largest possible weights do not.
+    Both are evaluated for the heaviest solution of each cost, exactly by DP for integer costs and otherwise by the LP relaxation. Cuts are ignored."""
+    weights,costs = asarray(weights,dtype=float),asarray(costs,dtype=float)
+    if min(costs) < 0 or c_max < 0: return {candidate:0 for candidate in range(c_min,c_max+1)}
+    largest_weights = floor(weights*(1+max_deviation)+1e-6) # Upper bounds of the integer weights in the CE subproblem
+    if use_dp(costs,c_max,(c_max+1)*side_constraint_states(constrained_set)):
+        with timed("Candidate bounds DP",phase=True):
+            best,best_largest = [dp_max_weight_per_cost(values,costs,c_max,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set) for values in [weights,largest_weights]]
+    else:
+        with timed("Candidate bounds",phase=True):
+            best,best_largest = [relaxed_max_weight_per_cost(values,costs,c_max,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements) for values in [weights,largest_weights]]
+    return {candidate:GRB.INFINITY if candidate < 0 or best_largest[candidate] < b - 1e-6 else max(b-best[candidate],0) for candidate in range(c_min,c_max+1)}
+
+def in_favoured_domain(solution,enforced_elements=[],disallowed_elements=[],constrained_set=[]) -> bool:
+    """ True if a solution, given as a list of items, lies in the favoured solution space."""
+    items = set(solution)
+    return set(enforced_elements) <= items and not items & set(disallowed_elements) and all(len(items & set(item['variables'])) <= item['rhs'] for item in constrained_set)
+
+def cut_valid_from(cut,costs,strong:bool,enforced_elements=[],disallowed_elements=[],constrained_set=[]) -> int:
+    """ Smallest objective candidate for which a y cut is valid. A cover that is cheaper than the candidate rules out a CE, 
+    for strong CEs so does a cover outside the favoured solution space that is as cheap. Ascending candidates only ever use valid cuts."""
+    cost = sum(costs[index] for index in cut)
+    if strong and not in_favoured_domain(cut,enforced_elements,disallowed_elements,constrained_set): return int(ceil(cost-1e-6))
+    return int(floor(cost+1e-6))+1
+
+class CounterfactualSubproblem:
+    """ CE subproblem that keeps one model alive for all objective candidates of a run.
+    Between candidates only the right-hand sides of the optimality and the cutoff constraint change, cuts that are not yet in the model are appended 
+    and start, e.g. the incumbent weights, is used as a warm start. Cuts that are not valid for a candidate yet (see cut_valid_from) are relaxed while it is solved,
+    so candidates can be solved in any order. Cuts that are no longer passed leave the model. The model is reset before each candidate and keeps its cuts 
+    in the order in which they are passed, so the result only depends on the candidate, the cutoff, start, the cuts and their ages (see cut_ages).
     max_deviation = maximum relative change to a,b in %, i.e. 0.05 -> 5%
+    max_cut_age = optional number of solved candidates after which a cut that was not binding in any of them leaves the model. 
+    It returns if it is violated again. None keeps all cuts.
+    lazy = False solves the model, checks the optimum with is_cf and resolves with the new cut until a CE is found. lazy = True instead checks every 
+    new incumbent with is_cf in a callback and rejects it with a lazy cut, so each candidate needs a single branch and cut.
+    item_bounds = optional lower bounds on the cost of favoured covers without and with each free item (see item_bounds in preprocessing.py).
+    Each candidate then fixes the items that all its solutions contain or leave out.
     """
-    indices = list(range(len(weights)))
-    m = gp.Model("CE-Knapsack-Subproblem")
-    m.Params.OutputFlag = 0
-    m.Params.LazyConstraints = 1 
+    def __init__(self,weights,costs,b,strong:bool,enforced_elements=[],disallowed_elements=[],constrained_set=[],max_deviation=0.05,max_cut_age=None,lazy=False,item_bounds=None):
+        self.weights,self.costs,self.b,self.strong,self.max_cut_age,self.lazy,self.item_bounds = weights,costs,b,strong,max_cut_age,lazy,item_bounds
+        self.enforced_elements,self.disallowed_elements,self.constrained_set = enforced_elements,disallowed_elements,constrained_set
+        build_start = time()
+        m = gp.Model("CE-Knapsack-Subproblem")
+        m.Params.OutputFlag = 0
+        m.Params.LazyConstraints = 1 
 
-    # Variables
-    x = m.addVars(indices,vtype=GRB.BINARY)
-    new_weights = m.addVars(indices,vtype=GRB.INTEGER,lb=weights*(1-max_deviation),ub=weights*(1+max_deviation))
-    delta_a = m.addVars(indices,vtype=GRB.CONTINUOUS) # Variables encoding norms
-    
-    # Constraints
-    m.addConstr(gp.quicksum(costs[index]*x[index] for index in indices) == target_objective) # Optimality
-    m.addConstr(gp.quicksum(new_weights[index]*x[index] for index in indices) >= b) # Feasibility in new A,b
-    m.addConstrs(x[index] == 0 for index in disallowed_elements) # Enforced parameter domains
-    m.addConstrs(x[index] == 1 for index in enforced_elements)
-    for item in constrained_set: m.addConstr(gp.quicksum(x[index] for index in item["variables"]) <= item['rhs'])
-    m.addConstrs(delta_a[index] >= new_weights[index] - weights[index] for index in indices) # Linking/Objective
-    m.addConstrs(delta_a[index] >= weights[index] - new_weights[index] for index in indices)
-    m.addConstr(gp.quicksum(delta_a[index] for index in indices) <= best_known_objective) # Cutting off solution space
-    y_constraints = {}
-    original_y_range = range(len(cuts))
-    for cutindex in original_y_range:
-        y_constraints[cutindex] = m.addConstr(gp.quicksum(new_weights[index] for index in cuts[cutindex]) <= b - 1) # y cuts added from previous iterations
-
-    # Objective
-    m.setObjective(gp.quicksum(delta_a[index] for index in indices),GRB.MINIMIZE)
-    
-    optimal =  False
-    counter = 0
-    while not optimal:
-        counter += 1
-        m.optimize()
-        if m.Status == GRB.INFEASIBLE: 
-            return None,None, GRB.INFINITY, m.Runtime, cuts
-        if timerlimit != None and time() > timerlimit:
-            if printout: print("Timelimit reached, stopping subproblem solve.")
+        # Variables, as vectors for reading and writing values and as lists for building expressions
+        x = m.addMVar(len(weights),vtype=GRB.BINARY)
+        self.weight_bounds = (asarray(weights,dtype=float),asarray(weights*(1+max_deviation),dtype=float)) # Largest new weight of left out items and of all others
+        new_weights = m.addMVar(len(weights),vtype=GRB.INTEGER,lb=weights*(1-max_deviation),ub=self.weight_bounds[1])
+        delta_a = m.addMVar(len(weights),vtype=GRB.CONTINUOUS) # Variables encoding norms
+        xs,ws,ds = x.tolist(),new_weights.tolist(),delta_a.tolist()
+        
+        # Constraints
+        self.optimality = m.addConstr(linear_expression(costs,xs) == 0) # Optimality, the right-hand side is the objective candidate
+        feasibility = gp.QuadExpr()
+        feasibility.addTerms([1.0]*len(weights),ws,xs)
+        m.addConstr(feasibility >= b) # Feasibility in new A,b
+        add_side_constraints(m,xs,enforced_elements,disallowed_elements,constrained_set) # Enforced parameter domains
+        add_deviation_constraints(m,ds,ws,weights) # Linking/Objective
+        self.cutoff = m.addConstr(linear_expression([1]*len(weights),ds) <= GRB.INFINITY) # Cutting off solution space, the right-hand side is the incumbent objective
+        self.y_constraints = {} # y cuts in the model, keyed by their set of items
+        self.valid_from,self.relaxed = {},set() # Smallest valid candidate per y cut and the y cuts that are currently relaxed
+        self.solves,self.last_active,self.retired = 0,{},set() # Solved candidates, the last one in which each y cut was binding and the aged out y cuts
+
+        # Objective
+        m.setObjective(linear_expression([1]*len(weights),ds),GRB.MINIMIZE)
+        built(m,build_start)
+        self.m,self.x,self.new_weights,self.delta_a,self.xs,self.ws = m,x,new_weights,delta_a,xs,ws
+        self.start = None # Weights used as MIP start, e.g. those of the incumbent
+        self.stats = {} # Cut rounds, branch and bound nodes and new cuts of the last solve
+        self.abandon = None # Optional function that stops a solve after the current cut round, e.g. once its result is no longer needed
+
+    def add_cut(self,cut):
+        """ Adds a y cut, unless the model already contains it. Returns False for cuts that were already there."""
+        key = frozenset(cut)
+        if key in self.y_constraints: return False
+        self.y_constraints[key] = self.m.addConstr(linear_expression([1]*len(cut),[self.ws[index] for index in cut]) <= self.b - 1) # Since any feasible solution has cTy >= v+1
+        self.valid_from[key] = cut_valid_from(cut,self.costs,self.strong,self.enforced_elements,self.disallowed_elements,self.constrained_set)
+        self.last_active[key] = self.solves
+        self.retired.discard(key)
+        return True
+
+    def remove_cut(self,key):
+        """ Removes a y cut, given by its set of items, from the model."""
+        self.m.remove(self.y_constraints.pop(key))
+        del self.valid_from[key]
+        self.last_active.pop(key,None) # Missing after set_cut_ages for cuts that another subproblem did not have
+        self.relaxed.discard(key)
+
+    def pool_cut(self,cut,cuts) -> bool:
+        """ Appends a y cut that was just added to the model to cuts. If cuts is a CutPool that rejects it, the pooled cuts that imply it 
+        replace it in the model, since they may have aged out of it. Returns whether cuts accepted the cut."""
+        if cuts.append(cut) != False: return True
+        key = frozenset(cut)
+        self.remove_cut(key)
+        for other in [other for other in cuts.keys() if other >= key]:
+            self.retired.discard(other)
+            self.add_cut(cuts.cuts[other])
+        return False
+
+    def sync_cuts(self,cuts):
+        """ Makes the y cuts of the model those of cuts that have not aged out, in the order of cuts. Cuts that left a CutPool are implied by pooled cuts
+        and are removed. Cuts that are in the model in a different order are added again and keep their age."""
+        wanted = [(key,cut) for key,cut in ((frozenset(cut),cut) for cut in cuts) if key not in self.retired]
+        ages,keys = dict(self.last_active),set(key for key,cut in wanted)
+        for key in [key for key in self.y_constraints if key not in keys]: self.remove_cut(key)
+        present = list(self.y_constraints)
+        kept = next((index for index,(key,(other,cut)) in enumerate(zip(present,wanted)) if key != other),len(present))
+        for key in present[kept:]: self.remove_cut(key)
+        for key,cut in wanted[kept:]: self.add_cut(cut)
+        self.last_active.update((key,ages[key]) for key,cut in wanted[kept:] if key in ages)
+
+    def cut_ages(self):
+        """ Number of solved candidates, the last one in which each y cut was binding and the aged out y cuts. Together with the cuts, 
+        they are the state that max_cut_age carries from one candidate to the next."""
+        return self.solves,dict(self.last_active),set(self.retired)
+
+    def set_cut_ages(self,ages):
+        """ Continues from the cut_ages of another subproblem of the same instance, e.g. in a parallel search."""
+        solves,last_active,retired = ages
+        self.solves,self.last_active,self.retired = solves,dict(last_active),set(retired)
+
+    def age_cuts(self):
+        """ Retires all y cuts that were not binding in the last max_cut_age solved candidates, called after each optimal solve."""
+        keys = [key for key in self.y_constraints if key not in self.relaxed]
+        for key,slack in zip(keys,self.m.getAttr("Slack",[self.y_constraints[key] for key in keys])):
+            if slack < 0.5: self.last_active[key] = self.solves
+            elif self.solves - self.last_active[key] > self.max_cut_age:
+                self.remove_cut(key)
+                self.retired.add(key)
+
+    def activate_cuts(self,target_objective):
+        """ Relaxes the y cuts that are not valid for an objective candidate and restores all others."""
+        relaxed = set(key for key,valid_from in self.valid_from.items() if valid_from > target_objective)
+        changed = list(relaxed ^ self.relaxed)
+        if changed != []:
+            self.m.update()
+            self.m.setAttr("RHS",[self.y_constraints[key] for key in changed],[GRB.INFINITY if key in relaxed else self.b - 1 for key in changed])
+        self.relaxed = relaxed
+
+    def fix_items(self,target_objective) -> bool:
+        """ Fixes the items that every solution with cost target_objective contains or leaves out. Left out items keep at most their original weight,
+        a larger one only adds covers that compete with the solution. Returns False if no solution has this cost."""
+        items,without,with_item = self.item_bounds
+        contained,left_out = without > target_objective + 1e-6,with_item > target_objective + 1e-6
+        if (contained & left_out).any(): return False
+        self.m.setAttr("LB",[self.xs[item] for item in items],contained.astype(float).tolist())
+        self.m.setAttr("UB",[self.xs[item] for item in items],(~left_out).astype(float).tolist())
+        self.m.setAttr("UB",[self.ws[item] for item in items],where(left_out,self.weight_bounds[0][items],self.weight_bounds[1][items]).tolist())
+        return True
+
+    def solve(self,target_objective,cuts=[],best_known_objective=GRB.INFINITY,timerlimit=None):
+        """ Solves the CE subproblem for one fixed objective value. New cuts are appended to cuts, which is returned as well.
+        Afterwards, stats holds the number of cut rounds, branch and bound nodes and new cuts of this solve."""
+        m,new_weights = self.m,self.new_weights
+        build_start = time()
+        self.optimality.RHS = target_objective
+        self.cutoff.RHS = best_known_objective
+        self.stats = {'rounds':0,'nodes':0,'cuts':0}
+        if self.item_bounds != None and not self.fix_items(target_objective): return None,None, GRB.INFINITY, 0, cuts
+        self.sync_cuts(cuts) # y cuts added from previous iterations
+        self.activate_cuts(target_objective)
+        m.reset(1) # Discards the solutions and MIP starts of earlier candidates
+        if self.start != None: 
+            m.update()
+            new_weights.Start = self.start
+        built(m,build_start)
+
+        if self.lazy: return self.branch_and_cut(cuts,timerlimit)
+        optimal =  False
+        counter = 0
+        while not optimal:
+            counter += 1
+            m.Params.TimeLimit = max(timerlimit - time(),0) if timerlimit != None else GRB.INFINITY
+            optimize(m)
+            self.stats['rounds'],self.stats['nodes'] = counter,self.stats['nodes']+int(m.NodeCount)
+            if m.Status == GRB.INFEASIBLE: 
+                return None,None, GRB.INFINITY, m.Runtime, cuts
+            if m.Status == GRB.TIME_LIMIT or (timerlimit != None and time() > timerlimit):
+                if printout: print("Timelimit reached, stopping subproblem solve.")
+                return None,None, GRB.INFINITY, m.Runtime, cuts
+            if self.abandon != None and self.abandon(): return None,None, GRB.INFINITY, m.Runtime, cuts
+            incumbent_weights = new_weights.X.round().astype(int).tolist()
+
+            cf_found, solution_or_counterexample = is_cf(incumbent_weights,self.costs,self.b,strong=self.strong,enforced_elements=self.enforced_elements,disallowed_elements=self.disallowed_elements,constrained_set=self.constrained_set)
+
+            if cf_found:    
+                if printout: print("ACTUALLY found a CE. Cost",m.getObjective().getValue(),"Solution:",solution_or_counterexample)
+                optimal = True
+            else: # Save the old solution to check if it changes
+                if not self.add_cut(solution_or_counterexample): # If the solution is already in the cuts, we do not add it again
+                    if printout:print("ERROR: Solution already in cuts, this should not happen",solution_or_counterexample)
+                    break
+                else:
+                    if self.pool_cut(solution_or_counterexample,cuts): self.stats['cuts'] += 1
+                    m.update()
+                    if printout:print("No CE found, adding cut",len(cuts),solution_or_counterexample)
+                    
+        return self.result(cuts)
+
+    def result(self,cuts):
+        """ Return values of solve after the model has been solved."""
+        m = self.m
+        if m.status == GRB.OPTIMAL:
+            new_weights = self.new_weights.X.round().astype(int).tolist()
+            self.solves += 1
+            if self.max_cut_age != None: self.age_cuts()
+            return new_weights,self.b, int(m.getObjective().getValue()), m.Runtime, cuts
+        else:
             return None,None, GRB.INFINITY, m.Runtime, cuts
-        incumbent_weights = [int(new_weights[index].x) for index in indices]
-
-        cf_found, solution_or_counterexample = is_cf(incumbent_weights,costs,b,strong=strong,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set)
-
-        if cf_found:    
-            if printout: print("ACTUALLY found a CE. Cost",m.getObjective().getValue(),"Solution:",solution_or_counterexample)
-            optimal = True
-        else: # Save the old solution to check if it changes
-            y_constraints[len(cuts)] = m.addConstr(gp.quicksum(new_weights[index] for index in solution_or_counterexample) <= b-1) # Since any feasible solution has cTy >= v+1
-            if solution_or_counterexample in cuts: # If the solution is already in the cuts, we do not add it again
-                if printout:print("ERROR: Solution already in cuts, this should not happen",solution_or_counterexample)
-                break
-            else:
-                cuts.append(solution_or_counterexample)
-                m.update()
-                if printout:print("No CE found, adding cut",len(cuts),solution_or_counterexample)
-                
-    if m.status == GRB.OPTIMAL:
-        return [int(new_weights[index].x) for index in indices],b, int(m.getObjective().getValue()), m.Runtime, cuts
-    else:
-        return None,None, GRB.INFINITY, m.Runtime, cuts
 
-def counterfactual_lb(weights,capacity,cuts=[],max_deviation=0.05):
-    """ Determines a CF lower bound for the 1-norm
+    def branch_and_cut(self,cuts,timerlimit=None):
+        """ Solves the current candidate in a single branch and cut. Every new incumbent is checked with is_cf in a MIPSOL callback 
+        and rejected with a lazy y cut if it is no CE. The lazy cuts become model constraints afterwards and are appended to cuts."""
+        m,new_weights = self.m,self.new_weights
+        found = {} # Lazy cuts of this solve, keyed by their set of items
+
+        def separate(model,where):
+            if where != GRB.Callback.MIPSOL: return
+            if self.abandon != None and self.abandon(): return model.terminate()
+            incumbent_weights = [int(round(value)) for value in model.cbGetSolution(self.ws)]
+            cf_found, counterexample = is_cf(incumbent_weights,self.costs,self.b,strong=self.strong,enforced_elements=self.enforced_elements,disallowed_elements=self.disallowed_elements,constrained_set=self.constrained_set)
+            if not cf_found:
+                model.cbLazy(linear_expression([1]*len(counterexample),[self.ws[index] for index in counterexample]) <= self.b - 1)
+                found.setdefault(frozenset(counterexample),counterexample)
+
+        m.Params.TimeLimit = max(timerlimit - time(),0) if timerlimit != None else GRB.INFINITY
+        optimize(m,separate)
+        self.stats['rounds'],self.stats['nodes'] = 1,int(m.NodeCount)
+        values = self.result(cuts) # Read before the model changes
+        for cut in found.values():
+            if self.add_cut(cut) and self.pool_cut(cut,cuts): self.stats['cuts'] += 1
+        return values
+
+def solve_counterfactual_subproblem(weights,costs,b,target_objective,strong:bool,cuts=[],best_known_objective=GRB.INFINITY,enforced_elements=[],disallowed_elements=[],constrained_set=[],max_deviation=0.05,timerlimit=None):
+    """ Solves a CE subproblem for one fixed objective values. Builds a new model, use CounterfactualSubproblem to solve several candidates.
     max_deviation = maximum relative change to a,b in %, i.e. 0.05 -> 5%
     """
-    indices = list(range(len(weights)))
-    m = gp.Model("CF-Knapsack-Subproblem")
-    m.Params.OutputFlag = 0
-    m.Params.LazyConstraints = 1 
+    subproblem = CounterfactualSubproblem(weights,costs,b,strong,enforced_elements=enforced_elements,disallowed_elements=disallowed_elements,constrained_set=constrained_set,max_deviation=max_deviation)
+    return subproblem.solve(target_objective,cuts,best_known_objective=best_known_objective,timerlimit=timerlimit)
 
-    # Variables
-    new_weights = m.addVars(indices,vtype=GRB.INTEGER,lb=weights*(1-max_deviation),ub=weights*(1+max_deviation))
-    delta_a = m.addVars(indices,vtype=GRB.CONTINUOUS,lb=0) # Variables encoding norms
-    
-    # Constraints
-    m.addConstrs(delta_a[index] >= new_weights[index] - weights[index] for index in indices) # Linking/Objective
-    m.addConstrs(delta_a[index] >= weights[index] - new_weights[index] for index in indices)
-    for cut in cuts:
-        m.addConstr(gp.quicksum(new_weights[index] for index in cut) <= capacity - 1) # y cuts added from previous iterations
-    m.update()
+class CounterfactualLowerBound:
+    """ CF lower bound for the 1-norm that keeps one model for a whole run and only adds cuts it does not contain yet. Cuts that are no longer 
+    passed, e.g. because they left a CutPool, are removed. Without new cuts, the last bound is returned without solving. Otherwise, the model is reoptimised starting from the last optimum.
+    max_deviation = maximum relative change to a,b in %, i.e. 0.05 -> 5%
+    covering_items = optional items that include all items of every CE solution, e.g. all items that are neither disallowed nor fixed out by preprocessing. 
+    Their new weights have to cover the capacity.
+    """
+    def __init__(self,weights,capacity,max_deviation=0.05,covering_items=None):
+        build_start = time()
+        self.capacity = capacity
+        m = gp.Model("CF-Knapsack-Subproblem")
+        m.Params.OutputFlag = 0
+        m.Params.LazyConstraints = 1 
 
-    m.setObjective(gp.quicksum(delta_a[index] for index in indices),GRB.MINIMIZE)
-    m.optimize()
+        # Variables, as vectors for reading and writing values and as lists for building expressions
+        new_weights = m.addMVar(len(weights),vtype=GRB.INTEGER,lb=weights*(1-max_deviation),ub=weights*(1+max_deviation))
+        delta_a = m.addMVar(len(weights),vtype=GRB.CONTINUOUS,lb=0) # Variables encoding norms
+        ws,ds = new_weights.tolist(),delta_a.tolist()
+        
+        # Constraints
+        add_deviation_constraints(m,ds,ws,weights) # Linking/Objective
+        if covering_items != None: m.addConstr(linear_expression([1]*len(covering_items),[ws[index] for index in covering_items]) >= capacity) # Some CE solution among them has to be feasible
+        m.setObjective(linear_expression([1]*len(weights),ds),GRB.MINIMIZE)
+        built(m,build_start)
+        self.m,self.new_weights,self.ws = m,new_weights,ws
+        self.y_constraints = {} # y cuts in the model, keyed by their set of items
+        self.lb,self.start = 0,None # Without cuts, the original weights are optimal
 
-    if m.status == GRB.OPTIMAL:
-        return m.getObjective().getValue(), m.Runtime
-    else:
-        return GRB.INFINITY, m.Runtime
\ No newline at end of file
+    def new_cuts(self,cuts):
+        """ Returns the cuts that are not in the model yet."""
+        return [cut for cut in cuts if frozenset(cut) not in self.y_constraints]
+
+    def solve(self,cuts=[]):
+        """ Adds all new cuts and returns the lower bound and the solver runtime, which is 0 if no new cut arrived."""
+        keys = set(frozenset(cut) for cut in cuts)
+        for key in [key for key in self.y_constraints if key not in keys]: self.m.remove(self.y_constraints.pop(key)) # Dominated cuts do not change the bound
+        new_cuts = self.new_cuts(cuts)
+        if new_cuts == [] or self.lb == GRB.INFINITY: return self.lb, 0 # More cuts cannot make an infeasible model feasible
+        build_start = time()
+        for cut in new_cuts:
+            self.y_constraints[frozenset(cut)] = self.m.addConstr(linear_expression([1]*len(cut),[self.ws[index] for index in cut]) <= self.capacity - 1) # y cuts added from previous iterations
+        self.m.update()
+        if self.start != None: self.new_weights.Start = self.start
+        built(self.m,build_start)
+        optimize(self.m)
+
+        if self.m.status == GRB.OPTIMAL:
+            self.lb = self.m.getObjective().getValue()
+            self.start = self.new_weights.X.tolist()
+        else:
+            self.lb = GRB.INFINITY
+        return self.lb, self.m.Runtime
+
+def counterfactual_lb(weights,capacity,cuts=[],max_deviation=0.05):
+    """ Determines a CF lower bound for the 1-norm. Builds a new model, use CounterfactualLowerBound to bound repeatedly.
+    max_deviation = maximum relative change to a,b in %, i.e. 0.05 -> 5%
+    """
+    return CounterfactualLowerBound(weights,capacity,max_deviation=max_deviation).solve(cuts)
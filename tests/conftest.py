@@ -0,0 +1,8 @@
+from os import chdir
+from os.path import dirname,abspath
+import sys
+
+# Tests import the modules of the repository and read data/ relative to it, as if main.py was run from the repository folder
+root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0,root)
+chdir(root)
@@ -0,0 +1,71 @@
+from random import Random
+from numpy import asarray
+import pytest
+import solver
+from dp import dp_solve_cover,dp_solve_knapsack,dp_seperate_minimal_inequality
+
+# Differential test of the DP oracles in dp.py against the Gurobi models in solver.py on small random instances with all side constraints
+cases = 500 # Per oracle
+
+@pytest.fixture
+def gurobi():
+    """ Solves the oracles of solver.py with Gurobi during a test."""
+    backend,solver.oracle_backend = solver.oracle_backend,"gurobi"
+    yield
+    solver.oracle_backend = backend
+
+def random_instance(random:Random):
+    """ Integer weights and costs with random enforced, disallowed, constrained and cover sets and a solution to deviate from."""
+    n = random.randint(1,12)
+    weights,costs = asarray([random.randint(1,60) for item in range(n)],dtype=float),asarray([random.randint(0,50) for item in range(n)],dtype=float)
+    items = random.sample(range(n),n)
+    enforced_elements,disallowed_elements = (items[:random.randint(0,2)],items[2:2+random.randint(0,2)]) if random.random() < 0.5 else ([],[])
+    constrained_set = [{'variables':random.sample(range(n),random.randint(1,n)),'rhs':random.randint(0,3)} for count in range(random.randint(0,2))]
+    cover_set = [{'variables':random.sample(range(n),random.randint(1,n)),'rhs':random.randint(0,3)} for count in range(random.randint(0,1))]
+    deviate_from_solution = random.sample(range(n),random.randint(0,n)) if random.random() < 0.4 else []
+    return weights,costs,{'enforced_elements':enforced_elements,'disallowed_elements':disallowed_elements,'constrained_set':constrained_set},cover_set,deviate_from_solution
+
+def feasible(solution,sides,cover_set=[],deviate_from_solution=[]) -> bool:
+    """ True if a solution satisfies the side constraints."""
+    items = set(solution)
+    return (set(sides['enforced_elements']) <= items and not items & set(sides['disallowed_elements'])
+            and all(len(items & set(item['variables'])) <= item['rhs'] for item in sides['constrained_set'])
+            and all(len(items & set(item['variables'])) >= item['rhs'] for item in cover_set)
+            and (deviate_from_solution == [] or items != set(deviate_from_solution)))
+
+def test_cover(gurobi):
+    random = Random(1)
+    for case in range(cases):
+        weights,costs,sides,cover_set,deviate_from_solution = random_instance(random)
+        b = random.randint(0,int(weights.sum())+5)
+        expected = solver.bip_solve_cover(weights,costs,b,cover_set=cover_set,deviate_from_solution=deviate_from_solution,**sides)
+        solution,objective,runtime = dp_solve_cover(weights,costs,b,cover_set=cover_set,deviate_from_solution=deviate_from_solution,**sides)
+        assert (solution == False) == (expected[0] == False), (case,weights,costs,b,sides,cover_set,deviate_from_solution)
+        if solution == False: continue
+        assert objective == expected[1] == costs[solution].sum(), case
+        assert weights[solution].sum() >= b and feasible(solution,sides,cover_set,deviate_from_solution), case
+
+def test_knapsack(gurobi):
+    random = Random(2)
+    for case in range(cases):
+        weights,costs,sides,cover_set,deviate_from_solution = random_instance(random)
+        b = random.randint(0,int(weights.sum()))
+        expected = solver.bip_solve_knapsack(weights,costs,b,deviate_from_solution=deviate_from_solution,**sides)
+        result = dp_solve_knapsack(weights,costs,b,deviate_from_solution=deviate_from_solution,**sides)
+        assert (result == False) == (expected == False), (case,weights,costs,b,sides,deviate_from_solution)
+        if result == False: continue
+        solution,objective,runtime = result
+        assert objective == expected[1] == costs[solution].sum(), case
+        assert weights[solution].sum() <= b and feasible(solution,sides,deviate_from_solution=deviate_from_solution), case
+
+def test_separation(gurobi):
+    random = Random(3)
+    for case in range(cases):
+        weights,costs,sides,cover_set,deviate_from_solution = random_instance(random)
+        weights = [int(weight) for weight in weights]
+        b,favoured_domain_objective = random.randint(0,sum(weights)+5),random.randint(0,int(costs.sum())+2)
+        expected = solver.seperate_minimal_inequality(weights,costs,b,favoured_domain_objective)
+        solution,weight,runtime = dp_seperate_minimal_inequality(weights,costs,b,favoured_domain_objective)
+        assert (solution == False) == (expected[0] == False), (case,weights,costs,b,favoured_domain_objective)
+        if solution == False: continue
+        assert weight == expected[1] == asarray(weights)[solution].sum() >= b and costs[solution].sum() <= favoured_domain_objective-1, case
@@ -0,0 +1,20 @@
+import pytest
+import profiling
+from main import run_experiment
+
+# The parallel candidate search has to log the same as the sequential search, apart from times and the profile
+timings = ['time_per_iteration_in_s','total_time_for_LBs','original_runtime','heuristic_time','profile','cache']
+experiments = [("uncorrelated",15,"p","0.05",1,"strong"),("strongly_correlated",10,"n","0.05",3,"X")]
+options = [{},{'order':"best-first"},{'lazy':True},{'max_cut_age':1}]
+
+@pytest.mark.parametrize("experiment",experiments)
+@pytest.mark.parametrize("option",options)
+def test_same_log(experiment,option):
+    profiling.verbose = False
+    sequential,name = run_experiment(*experiment,**option)
+    parallel,name = run_experiment(*experiment,workers=3,**option)
+    sequential,parallel = sequential['result'],parallel['result']
+    assert sorted(sequential) == sorted(parallel)
+    for key in sequential:
+        if key not in timings: assert sequential[key] == parallel[key], key
+    assert list(sequential['time_per_iteration_in_s']) == list(parallel['time_per_iteration_in_s'])
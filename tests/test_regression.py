@@ -0,0 +1,20 @@
+import json as j
+import pytest
+import profiling
+from main import run_experiment,result_name
+
+# Small experiments of the computational study whose results are in the results folder, covering both instance types, 
+# positive and negative fixations, weak and strong CEs, runs that find a CE and runs that show that none exists
+experiments = [("uncorrelated",10,"p","0.05",14,"X"),("uncorrelated",10,"n","0.05",13,"strong"),("strongly_correlated",10,"n","0.05",4,"X"),
+               ("strongly_correlated",10,"n","0.05",3,"strong"),("uncorrelated",15,"p","0.05",1,"strong"),("uncorrelated",15,"p","0.05",6,"strong"),
+               ("uncorrelated",10,"n","0.05",11,"strong"),("uncorrelated",8,"n","0.05",15,"strong")]
+
+@pytest.mark.parametrize("experiment",experiments)
+def test_same_result(experiment):
+    profiling.verbose = False
+    tracked_data,name = run_experiment(*experiment)
+    with open('results/'+result_name(*experiment)+'.json') as file:
+        reference = j.load(file)['result']
+    assert tracked_data['result']['Final_UB'] == reference['Final_UB']
+    if 'final_solution_delta' in tracked_data['result']: # The CE may differ, but has the same 1-norm
+        assert sum(abs(delta) for delta in tracked_data['result']['final_solution_delta']) == reference['Final_UB']